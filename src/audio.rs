@@ -2,26 +2,33 @@ use anyhow::{Result, anyhow};
 use cpal::traits::{DeviceTrait, HostTrait, StreamTrait};
 use cpal::Host;
 use std::sync::atomic::{AtomicBool, Ordering};
-use std::sync::Arc;
+use std::sync::{Arc, Mutex, OnceLock, TryLockError};
 use std::path::Path;
+use std::process::Child;
+use std::ops::{Deref, DerefMut};
 use std::io::Write;
 use std::thread;
-use whisper_rs::{FullParams, SamplingStrategy, WhisperContext};
-use tokio::runtime::Runtime;
+use whisper_rs::{FullParams, SamplingStrategy, WhisperContext, WhisperContextParameters};
+use tokio::io::AsyncWriteExt;
+use tokio::runtime::{Builder, Runtime};
 use futures_util::StreamExt;
 use reqwest::Client;
 #[cfg(target_os = "linux")]
 use std::process::Command;
+use crate::ring::{sample_ring, RingConsumer, RingProducer};
+#[cfg(target_os = "linux")]
+use crate::system_audio::{list_pulse_sources, pulse_available};
 use crate::data::{
     AudioMessage, InterlocutorProfile, LanguageConfig, SourceType, DeviceInfo, UiSender,
-    WHISPER_SAMPLE_RATE, CHUNK_DURATION_SECS, SILENCE_THRESHOLD
+    WHISPER_SAMPLE_RATE, CHUNK_DURATION_SECS, CHUNK_OVERLAP_PERCENT, SILENCE_THRESHOLD,
+    VOICE_FRAME_RMS, VOICE_MIN_FRAMES,
 };
 
 // ── Enumeración de dispositivos ────────────────────────────────────────────
 
 pub fn get_available_devices(host: &Host, is_input: bool) -> Vec<DeviceInfo> {
     #[cfg(target_os = "linux")]
-    if is_input {
+    if is_input && pulse_available() {
         return get_linux_input_devices();
     }
 
@@ -59,271 +66,340 @@ pub fn get_available_devices(host: &Host, is_input: bool) -> Vec<DeviceInfo> {
 
 #[cfg(target_os = "linux")]
 fn get_linux_input_devices() -> Vec<DeviceInfo> {
-    let mut devices = vec![];
-
-    let output = Command::new("pactl")
-        .args(&["list", "sources", "short"])
-        .output();
-
-    if let Ok(out) = output {
-        let sources = String::from_utf8_lossy(&out.stdout);
-
-        for line in sources.lines() {
-            let parts: Vec<&str> = line.split_whitespace().collect();
-            if parts.len() >= 2 {
-                let tech_name = parts[1].to_string();
-
-                if !tech_name.contains(".monitor") && tech_name.starts_with("alsa_input") {
-                    let mut description = tech_name.clone();
-
-                    if let Ok(desc_out) = Command::new("pactl").args(&["list", "sources"]).output() {
-                        let full_list = String::from_utf8_lossy(&desc_out.stdout);
-                        let mut found = false;
-                        for desc_line in full_list.lines() {
-                            if desc_line.contains(&format!("Name: {}", tech_name)) {
-                                found = true;
-                            } else if found && desc_line.trim().starts_with("Description:") {
-                                description = desc_line.replace("Description:", "").trim().to_string();
-                                break;
-                            }
-                        }
-                    }
-
-                    devices.push(DeviceInfo {
-                        id: devices.len(),
-                        name: description,
-                        technical_name: Some(tech_name),
-                    });
-                }
-            }
-        }
-    }
-
-    devices
+    list_pulse_sources()
+        .into_iter()
+        .filter(|(tech_name, _)| !tech_name.contains(".monitor") && tech_name.starts_with("alsa_input"))
+        .enumerate()
+        .map(|(id, (tech_name, description))| DeviceInfo {
+            id,
+            name: description,
+            technical_name: Some(tech_name),
+        })
+        .collect()
 }
 
 // ── Hilo principal de audio ────────────────────────────────────────────────
 
 pub fn audio_thread_main(
-    model_name: String,
+    model_name: &'static str,
     tx_ui: UiSender,
     stop_signal: Arc<AtomicBool>,
     profiles: Vec<InterlocutorProfile>,
     lang_config: LanguageConfig,
 ) -> Result<()> {
-    tx_ui.send(AudioMessage::Status("Verificando modelo...".to_string()))?;
+    // Un solo contexto (los pesos del modelo) para todos los streams; cada
+    // uno crea su propio estado. Antes cada stream cargaba el modelo entero.
+    tx_ui.send(AudioMessage::Status("Cargando modelo...".into()))?;
+    let ctx = load_whisper_context(model_name, &stop_signal)?;
+    let n_threads = whisper_threads_per_stream(profiles.len());
 
-    let model_path = Runtime::new()?
-        .block_on(download_whisper_model(&model_name))?;
+    let mut handles = Vec::with_capacity(profiles.len());
 
     for profile in profiles {
         let tx_func = tx_ui.clone();
         let tx_err  = tx_ui.clone();
         let stop    = stop_signal.clone();
-        let model   = model_path.clone();
-        let lang    = lang_config.clone();
+        let ctx     = ctx.clone();
+        let lang    = lang_config;
         let name    = profile.name.clone();
 
-        thread::spawn(move || {
-            if let Err(e) = run_single_stream(profile, model, tx_func, stop, lang) {
-                let _ = tx_err.send(AudioMessage::Error(format!("Error en {}: {:?}", name, e)));
+        // Cada hilo devuelve si terminó con error
+        handles.push(thread::spawn(move || {
+            match run_single_stream(profile, ctx, n_threads, tx_func, stop, lang) {
+                Ok(()) => false,
+                Err(e) => {
+                    let _ = tx_err.send(AudioMessage::Error(format!("Error en {}: {:?}", name, e)));
+                    true
+                }
             }
-        });
+        }));
     }
 
-    while !stop_signal.load(Ordering::SeqCst) {
-        thread::sleep(std::time::Duration::from_millis(50));
+    // Cada hilo termina por sí solo al ver la señal de parada: esperamos
+    // a que acaben en lugar de sondear la señal cada pocos milisegundos.
+    let mut failed = false;
+    for handle in handles {
+        failed |= handle.join().unwrap_or(true);
     }
 
-    tx_ui.send(AudioMessage::Status("Captura finalizada.".to_string()))?;
+    // El error de un stream se queda en la barra de estado: es lo único que
+    // explica al usuario por qué se paró la captura.
+    if !failed {
+        tx_ui.send(AudioMessage::Status("Captura finalizada.".into()))?;
+    }
     Ok(())
 }
 
 fn run_single_stream(
     profile: InterlocutorProfile,
-    model_path: String,
+    ctx: Arc<WhisperContext>,
+    n_threads: i32,
     tx_ui: UiSender,
     stop_signal: Arc<AtomicBool>,
     lang_config: LanguageConfig,
 ) -> Result<()> {
+    // Sin PulseAudio/PipeWire (ALSA puro) Linux también captura con cpal.
     #[cfg(target_os = "linux")]
-    return run_single_stream_linux(profile, model_path, tx_ui, stop_signal, lang_config);
+    if pulse_available() {
+        return run_single_stream_linux(profile, ctx, n_threads, tx_ui, stop_signal, lang_config);
+    }
 
-    #[cfg(not(target_os = "linux"))]
-    run_single_stream_cpal(profile, model_path, tx_ui, stop_signal, lang_config)
+    run_single_stream_cpal(profile, ctx, n_threads, tx_ui, stop_signal, lang_config)
+}
+
+/// Hilos de cómputo de Whisper para cada stream: los núcleos disponibles
+/// repartidos entre los streams simultáneos, para que no compitan por la
+/// CPU. Whisper apenas escala por encima de 8 hilos.
+pub fn whisper_threads_per_stream(streams: usize) -> i32 {
+    let cores = thread::available_parallelism().map(|n| n.get()).unwrap_or(4);
+    (cores / streams.max(1)).clamp(1, 8) as i32
 }
 
 // ── Captura Linux (parecord / PipeWire) ───────────────────────────────────
 
+/// Latencia objetivo que se pide a PulseAudio/PipeWire al lanzar `parecord`.
+#[cfg(target_os = "linux")]
+const CAPTURE_LATENCY_MS: u32 = 20;
+
+/// Lectura máxima de la tubería de `parecord`: su capacidad por defecto en
+/// Linux (64 KiB, ~1 s de audio). Si el lector se retrasa, lo acumulado se
+/// recoge en una sola llamada.
+#[cfg(target_os = "linux")]
+const PARECORD_READ_BLOCK: usize = 64 * 1024;
+
+// Múltiplo del tamaño de muestra float32le, para que un bloque lleno nunca
+// termine a mitad de muestra.
+#[cfg(target_os = "linux")]
+const _: () = assert!(PARECORD_READ_BLOCK % 4 == 0);
+
 #[cfg(target_os = "linux")]
 fn run_single_stream_linux(
     profile: InterlocutorProfile,
-    model_path: String,
+    ctx: Arc<WhisperContext>,
+    n_threads: i32,
     tx_ui: UiSender,
     stop_signal: Arc<AtomicBool>,
     lang_config: LanguageConfig,
 ) -> Result<()> {
     use std::process::Stdio;
-    use std::io::Read;
 
-    let ctx = WhisperContext::new_with_params(&model_path, Default::default())
-        .map_err(|e| anyhow!("Error cargando modelo: {:?}", e))?;
-    let mut state = ctx.create_state()
-        .map_err(|e| anyhow!("Error creando estado: {:?}", e))?;
+    let mut decoder = StreamDecoder::new(&ctx, n_threads, &lang_config, &stop_signal)?;
 
     let device_name = profile.technical_name
         .ok_or_else(|| anyhow!("Dispositivo sin nombre técnico. Recarga la aplicación."))?;
 
-    let check = Command::new("pactl").args(&["list", "sources", "short"]).output()?;
-    let sources = String::from_utf8_lossy(&check.stdout);
-    if !sources.contains(&device_name) {
-        return Err(anyhow!(
-            "Dispositivo '{}' no encontrado.\n\nDispositivos disponibles:\n{}",
-            device_name, sources
-        ));
-    }
-
     let source_icon = match profile.source_type { SourceType::Input => "🎤", SourceType::Output => "🔊" };
     tx_ui.send(AudioMessage::Status(format!(
         "{} {} - {} (16kHz mono) [{}→{}]",
         source_icon, profile.name, device_name,
         lang_config.source_label(), lang_config.dest_label(),
-    )))?;
-
-    let mut child = Command::new("parecord")
-        .args(&["--device", &device_name, "--rate", "16000",
-                "--channels", "1", "--format", "s16le", "--raw"])
+    ).into()))?;
+
+    // Sin --latency-msec PulseAudio usa su latencia por defecto (~2 s de
+    // buffer en el servidor) y entrega el audio a trompicones.
+    let latency = format!("--latency-msec={}", CAPTURE_LATENCY_MS);
+    let rate = WHISPER_SAMPLE_RATE.to_string();
+    // En float32, el formato con el que trabaja PipeWire y el que espera
+    // Whisper: el servidor no cuantiza a 16 bits ni hay que deshacerlo aquí.
+    let mut child = ChildGuard(Command::new("parecord")
+        .args(&["--device", &device_name, "--rate", &rate,
+                "--channels", "1", "--format", "float32le", "--raw", &latency])
         .stdout(Stdio::piped())
         .spawn()
-        .map_err(|e| anyhow!("Error iniciando parecord: {:?}. ¿Está instalado?", e))?;
+        .map_err(|e| anyhow!("Error iniciando parecord: {:?}. ¿Está instalado?", e))?);
 
-    let mut stdout = child.stdout.take()
+    let stdout = child.stdout.take()
         .ok_or_else(|| anyhow!("No se pudo obtener stdout de parecord"))?;
 
-    let mut accumulated: Vec<f32> = Vec::new();
-    let target = (WHISPER_SAMPLE_RATE * CHUNK_DURATION_SECS) as usize;
-    let mut buf = vec![0u8; 4096];
+    let windows = Windowing::at(WHISPER_SAMPLE_RATE);
+
+    // La tubería la vacía un hilo aparte: mientras Whisper procesa una
+    // ventana el audio sigue entrando en la cola, en vez de llenar los 64 KiB
+    // de la tubería y dejar a parecord bloqueado. La cola admite un lote
+    // entero; si se llena (Whisper va más de 30 s por detrás) se descarta
+    // el audio más nuevo, con memoria acotada.
+    let (producer, mut consumer) = sample_ring(windows.max_batch);
+    let reader = thread::spawn(move || read_parecord_pipe(stdout, producer));
+    let mut accumulated: Vec<f32> = Vec::with_capacity(windows.capacity());
+    let name: Arc<str> = profile.name.as_str().into();
 
     loop {
-        if stop_signal.load(Ordering::SeqCst) { let _ = child.kill(); break; }
+        if stop_signal.load(Ordering::SeqCst) { break; }
+
+        consumer.wait_for(windows.missing(&accumulated), STOP_POLL_INTERVAL);
+
+        if consumer.pop_into(&mut accumulated) == 0 {
+            // parecord ha terminado (o no llegó a arrancar) y ya no queda audio
+            if reader.is_finished() { break; }
+            continue;
+        }
+
+        windows.process_ready(&mut accumulated, |batch| {
+            process_and_send(batch, &mut decoder, &name, &tx_ui)
+        })?;
+    }
+
+    // Matar parecord cierra la tubería y el lector termina
+    drop(child);
+    let received = reader.join()
+        .map_err(|_| anyhow!("El hilo lector de parecord terminó inesperadamente"))??;
+
+    // parecord sale sin escribir nada si el dispositivo no existe. Se
+    // comprueba aquí, en el caso raro, en vez de lanzar `pactl` antes de
+    // cada captura.
+    if !received && !stop_signal.load(Ordering::SeqCst) {
+        let check = Command::new("pactl").args(&["list", "sources", "short"]).output()?;
+        return Err(anyhow!(
+            "Dispositivo '{}' no encontrado.\n\nDispositivos disponibles:\n{}",
+            device_name, String::from_utf8_lossy(&check.stdout)
+        ));
+    }
+
+    Ok(())
+}
 
-        match stdout.read(&mut buf) {
-            Ok(0) => break,
+/// Lee el PCM float32le de `parecord` hasta que se cierra la tubería y lo
+/// deja en la cola. Devuelve si llegó a recibir algún dato.
+#[cfg(target_os = "linux")]
+fn read_parecord_pipe(mut stdout: impl std::io::Read, mut producer: RingProducer) -> Result<bool> {
+    let mut buf = vec![0u8; PARECORD_READ_BLOCK];
+    let mut received = false;
+    // Bytes al inicio de `buf` que quedaron de la lectura anterior (una
+    // muestra cortada). Se completan con la siguiente.
+    let mut carry = 0usize;
+
+    loop {
+        match stdout.read(&mut buf[carry..]) {
+            Ok(0) => return Ok(received),
             Ok(n) => {
-                for chunk in buf[..n].chunks_exact(2) {
-                    let s = i16::from_le_bytes([chunk[0], chunk[1]]);
-                    accumulated.push(s as f32 / 32768.0);
-                }
-                if accumulated.len() >= target {
-                    process_and_send(&accumulated[..target], &mut state, &lang_config, &profile.name, &tx_ui)?;
-                    let overlap = target * 3 / 10;
-                    accumulated = accumulated.split_off(accumulated.len().saturating_sub(overlap));
-                }
-            }
-            Err(e) if e.kind() == std::io::ErrorKind::WouldBlock => {
-                thread::sleep(std::time::Duration::from_millis(10));
+                received = true;
+                let filled = carry + n;
+                let aligned = filled & !3;
+                producer.push_iter(
+                    buf[..aligned].chunks_exact(4)
+                        .map(|b| f32::from_le_bytes([b[0], b[1], b[2], b[3]]))
+                );
+                carry = filled - aligned;
+                buf.copy_within(aligned..filled, 0);
             }
+            // stdout de parecord es bloqueante: nunca devuelve WouldBlock
+            Err(e) if e.kind() == std::io::ErrorKind::Interrupted => continue,
             Err(e) => return Err(anyhow!("Error leyendo audio: {:?}", e)),
         }
     }
-
-    Ok(())
 }
 
 // ── Captura multiplataforma (cpal / WASAPI / CoreAudio) ───────────────────
 //
-// Windows : WASAPI — micrófonos + Stereo Mix (si habilitado) como inputs
+// Windows : WASAPI — micrófonos como inputs, salidas en modo loopback
 // macOS   : CoreAudio — micrófonos + BlackHole/Soundflower como inputs
-// Linux   : solo se usa para outputs cpal (los inputs van por parecord)
+// Linux   : respaldo con ALSA (snd-aloop como loopback) si no hay pactl
+
+/// Bloque pedido al driver (frames). Potencia de dos.
+const CAPTURE_BLOCK_FRAMES: u32 = 1024;
+
+const _: () = assert!(CAPTURE_BLOCK_FRAMES.is_power_of_two());
+
+/// Espera máxima por audio nuevo: acota lo que tarda un stream mudo en ver
+/// la señal de parada.
+const STOP_POLL_INTERVAL: std::time::Duration = std::time::Duration::from_millis(100);
 
-#[cfg(not(target_os = "linux"))]
 fn run_single_stream_cpal(
     profile: InterlocutorProfile,
-    model_path: String,
+    ctx: Arc<WhisperContext>,
+    n_threads: i32,
     tx_ui: UiSender,
     stop_signal: Arc<AtomicBool>,
     lang_config: LanguageConfig,
 ) -> Result<()> {
     let host = cpal::default_host();
 
-    let ctx = WhisperContext::new_with_params(&model_path, Default::default())
-        .map_err(|e| anyhow!("Error cargando modelo: {:?}", e))?;
-    let mut state = ctx.create_state()
-        .map_err(|e| anyhow!("Error creando estado: {:?}", e))?;
+    let mut decoder = StreamDecoder::new(&ctx, n_threads, &lang_config, &stop_signal)?;
 
-    // Buscar dispositivo por nombre técnico en la lista de inputs.
-    // En Windows/macOS, tanto micrófonos como dispositivos loopback
-    // (Stereo Mix, BlackHole) aparecen como inputs en cpal.
+    // Buscar dispositivo por nombre técnico. En Windows las fuentes de tipo
+    // Salida son dispositivos de reproducción que se capturan en loopback;
+    // el resto (micrófonos, BlackHole en macOS) son inputs de cpal.
     let tech_name = profile.technical_name.clone()
         .ok_or_else(|| anyhow!(
             "Dispositivo sin nombre técnico. Reconfigura el perfil en Ajustes."
         ))?;
 
-    let device = host.input_devices()?
-        .find(|d| {
-            d.description()
-                .map(|desc| desc.name() == tech_name.as_str())
-                .unwrap_or(false)
-        })
+    let (device, is_render_loopback) = find_capture_device(&host, &tech_name, profile.source_type)
         .ok_or_else(|| anyhow!(
             "Dispositivo '{}' no encontrado.\n\
              • Windows: comprueba que el dispositivo sigue conectado.\n\
-             • Para captura de sistema: activa 'Stereo Mix' en el panel de sonido.",
+             • Para captura de sistema: elige como fuente de tipo Salida tus altavoces o auriculares.",
             tech_name
         ))?;
 
-    let config = device.default_input_config()?;
+    // En loopback el formato lo fija la mezcla del dispositivo de reproducción
+    let config = if is_render_loopback {
+        device.default_output_config()?
+    } else {
+        preferred_input_config(&device)?
+    };
     let sample_rate = u32::from(config.sample_rate());
     let channels = config.channels() as usize;
 
+    // Pedimos un bloque fijo y pequeño si el driver lo admite; por defecto
+    // WASAPI/CoreAudio eligen buffers de latencia alta.
+    let mut stream_config = config.config();
+    if let cpal::SupportedBufferSize::Range { min, max } = *config.buffer_size() {
+        stream_config.buffer_size =
+            cpal::BufferSize::Fixed(CAPTURE_BLOCK_FRAMES.max(min).min(max));
+    }
+
     let source_icon = match profile.source_type { SourceType::Input => "🎤", SourceType::Output => "🔊" };
     tx_ui.send(AudioMessage::Status(format!(
         "{} {} - {} ({}Hz, {}ch) [{}→{}]",
         source_icon, profile.name, tech_name,
         sample_rate, channels,
         lang_config.source_label(), lang_config.dest_label(),
-    )))?;
-
-    let (audio_tx, audio_rx) = std::sync::mpsc::channel::<Vec<f32>>();
-    let name_cb = profile.name.clone();
-
-    let stream = device.build_input_stream(
-        &config.into(),
-        move |data: &[f32], _: &cpal::InputCallbackInfo| {
-            let _ = audio_tx.send(data.to_vec());
-        },
-        move |err| eprintln!("Error en stream [{}]: {}", name_cb, err),
-        None,
-    )?;
+    ).into()))?;
+
+    // Algunos drivers anuncian un rango de bloques y luego rechazan un
+    // tamaño fijo: en ese caso se abre con el bloque que elija el driver.
+    let (stream, mut consumer) =
+        match open_mono_input_stream(&device, config.sample_format(), &stream_config, &profile.name) {
+            Ok(opened) => opened,
+            Err(_) if matches!(stream_config.buffer_size, cpal::BufferSize::Fixed(_)) => {
+                stream_config.buffer_size = cpal::BufferSize::Default;
+                open_mono_input_stream(&device, config.sample_format(), &stream_config, &profile.name)?
+            }
+            Err(e) => return Err(e),
+        };
     stream.play()?;
 
-    let mut accumulated: Vec<f32> = Vec::new();
-    let target = (sample_rate * CHUNK_DURATION_SECS) as usize;
+    let windows = Windowing::at(sample_rate);
+    let mut accumulated: Vec<f32> = Vec::with_capacity(windows.capacity());
+    let name: Arc<str> = profile.name.as_str().into();
+    let needs_resample = sample_rate != WHISPER_SAMPLE_RATE;
+    // Destino del remuestreo, reutilizado entre ventanas
+    let mut resampled: Vec<f32> = Vec::with_capacity(if needs_resample {
+        (WHISPER_SAMPLE_RATE * WHISPER_WINDOW_SECS) as usize
+    } else {
+        0
+    });
 
     loop {
         if stop_signal.load(Ordering::SeqCst) { break; }
 
-        match audio_rx.recv_timeout(std::time::Duration::from_millis(100)) {
-            Ok(buf) => {
-                let mono = if channels > 1 { to_mono(&buf, channels) } else { buf };
-                accumulated.extend_from_slice(&mono);
-
-                if accumulated.len() >= target {
-                    let audio = if sample_rate != WHISPER_SAMPLE_RATE {
-                        resample(&accumulated[..target], sample_rate, WHISPER_SAMPLE_RATE)
-                    } else {
-                        accumulated[..target].to_vec()
-                    };
-
-                    process_and_send(&audio, &mut state, &lang_config, &profile.name, &tx_ui)?;
-
-                    let overlap = target * 3 / 10;
-                    accumulated = accumulated.split_off(accumulated.len().saturating_sub(overlap));
-                }
-            }
-            Err(std::sync::mpsc::RecvTimeoutError::Timeout) => continue,
-            Err(std::sync::mpsc::RecvTimeoutError::Disconnected) => break,
-        }
+        // Se duerme hasta completar la ventana (o hasta el siguiente sondeo
+        // de la señal de parada), no en cada bloque que entrega el driver.
+        consumer.wait_for(windows.missing(&accumulated), STOP_POLL_INTERVAL);
+
+        if consumer.pop_into(&mut accumulated) == 0 { continue; }
+
+        windows.process_ready(&mut accumulated, |batch| {
+            // A 16 kHz la ventana se pasa tal cual, sin copiarla
+            let audio: &[f32] = if needs_resample {
+                resample_into(batch, sample_rate, WHISPER_SAMPLE_RATE, &mut resampled);
+                &resampled
+            } else {
+                batch
+            };
+            process_and_send(audio, &mut decoder, &name, &tx_ui)
+        })?;
     }
 
     Ok(())
@@ -331,19 +407,24 @@ fn run_single_stream_cpal(
 
 // ── Helpers de audio compartidos ──────────────────────────────────────────
 
-/// Normaliza, comprueba silencio y envía a Whisper. Compartido por ambas rutas.
-fn process_and_send(
-    audio: &[f32],
-    state: &mut whisper_rs::WhisperState,
-    lang_config: &LanguageConfig,
-    name: &str,
-    tx_ui: &UiSender,
-) -> Result<()> {
-    let normalized = normalize_audio(audio);
-    if calculate_rms(&normalized) < SILENCE_THRESHOLD {
-        return Ok(());
-    }
+/// Audio que el codificador de Whisper procesa en cada pasada. Una ventana
+/// más corta se rellena hasta esta duración: procesar 5 s o 30 s cuesta lo
+/// mismo.
+const WHISPER_WINDOW_SECS: u32 = 30;
 
+/// Escala de PCM de 16 bits a [-1, 1). Es 1/32768 y no 1/32767 para que la
+/// conversión sea exacta en ambos sentidos. Se multiplica por la inversa:
+/// el bucle de conversión queda sin divisiones y se vectoriza.
+const PCM16_SCALE: f32 = 1.0 / 32768.0;
+
+/// Duración del solape entre ventanas en las unidades de los timestamps de
+/// Whisper (centésimas de segundo desde el inicio del audio procesado).
+const OVERLAP_CENTISECS: i64 =
+    (CHUNK_DURATION_SECS as usize * 100 * CHUNK_OVERLAP_PERCENT / 100) as i64;
+
+/// Parámetros de decodificación comunes a la captura en vivo y al vídeo.
+/// Se construyen una vez por sesión y cada ventana usa una copia.
+pub fn transcription_params(lang_config: &LanguageConfig) -> FullParams<'static, 'static> {
     let mut params = FullParams::new(SamplingStrategy::Greedy { best_of: 1 });
     params.set_language(lang_config.source_lang);
     params.set_translate(lang_config.translate_to_english);
@@ -354,23 +435,104 @@ fn process_and_send(
     params.set_suppress_blank(true);
     params.set_suppress_nst(true);
     params.set_no_speech_thold(0.6);
+    params
+}
+
+/// Hace que Whisper abandone la ventana en curso en cuanto se activa
+/// `stop_signal`. Sin esto, "Detener" o "Cancelar" esperan a que termine
+/// de decodificarse la ventana entera (segundos con los modelos grandes).
+pub fn abort_on_stop(params: &mut FullParams<'static, 'static>, stop_signal: &Arc<AtomicBool>) {
+    let stop = stop_signal.clone();
+    params.set_abort_callback_safe(move || stop.load(Ordering::Relaxed));
+}
+
+/// Lo que cada stream necesita para transcribir: su estado de Whisper sobre
+/// el contexto compartido, sus parámetros (con su parte de los hilos de
+/// cómputo) y el buffer de la ventana normalizada, que se reutiliza entre
+/// ventanas.
+struct StreamDecoder {
+    state: whisper_rs::WhisperState,
+    params: FullParams<'static, 'static>,
+    window: Vec<f32>,
+    /// La ventana anterior se transcribió: la siguiente empieza con un solape
+    /// ya emitido y puede usar su texto como contexto.
+    has_previous: bool,
+}
 
-    if let Ok(_) = state.full(params, &normalized) {
+impl StreamDecoder {
+    fn new(
+        ctx: &WhisperContext,
+        n_threads: i32,
+        lang_config: &LanguageConfig,
+        stop_signal: &Arc<AtomicBool>,
+    ) -> Result<Self> {
+        let state = ctx.create_state()
+            .map_err(|e| anyhow!("Error creando estado: {:?}", e))?;
+        let mut params = transcription_params(lang_config);
+        params.set_n_threads(n_threads);
+        abort_on_stop(&mut params, stop_signal);
+        Ok(Self {
+            state,
+            params,
+            window: Vec::with_capacity((WHISPER_SAMPLE_RATE * WHISPER_WINDOW_SECS) as usize),
+            has_previous: false,
+        })
+    }
+}
+
+/// Normaliza, comprueba silencio y envía a Whisper. Compartido por ambas rutas.
+fn process_and_send(
+    audio: &[f32],
+    decoder: &mut StreamDecoder,
+    name: &Arc<str>,
+    tx_ui: &UiSender,
+) -> Result<()> {
+    let StreamDecoder { state, params, window, has_previous } = decoder;
+    // Los segmentos que terminan dentro del solape ya salieron enteros en
+    // la ventana anterior: no se repiten.
+    let skip_until = if *has_previous { OVERLAP_CENTISECS } else { 0 };
+
+    // Cada ventana de un lote se evalúa por separado: una frase corta no se
+    // pierde por el silencio del resto del lote. Una ventana descartada no
+    // emite nada, así que su solape sí debe salir en la siguiente.
+    let window_len = (WHISPER_SAMPLE_RATE * CHUNK_DURATION_SECS) as usize;
+    if audio.chunks(window_len).all(is_silent_window) {
+        *has_previous = false;
+        return Ok(());
+    }
+    let (peak, _) = peak_and_rms(audio);
+    let gain = normalization_gain(peak);
+    window.clear();
+    window.extend(audio.iter().map(|&s| s * gain));
+
+    // Tras una ventana transcrita, su texto es el contexto de esta (whisper.cpp
+    // lo guarda en el estado del stream): las palabras cortadas en la
+    // frontera salen más estables. Tras un silencio o un fallo se empieza de
+    // cero, para no arrastrar alucinaciones de una ventana a otra.
+    let mut window_params = params.clone();
+    window_params.set_no_context(!*has_previous);
+
+    // `full` calcula el log-mel dentro de whisper.cpp, repartido entre los
+    // hilos del stream y con el banco de filtros que se cargó una sola vez
+    // con el modelo: basta con pasarle el PCM ya normalizado.
+    *has_previous = state.full(window_params, window).is_ok();
+    if *has_previous {
         let n = state.full_n_segments();
         if n > 0 {
             let mut text = String::new();
             for i in 0..n {
                 if let Some(seg) = state.get_segment(i) {
-                    let t = seg.to_string().trim().to_string();
-                    if !t.is_empty() && t.len() > 1 {
-                        text.push_str(&t);
-                        text.push(' ');
+                    if seg.end_timestamp() <= skip_until { continue; }
+                    let Ok(seg) = seg.to_str_lossy() else { continue };
+                    let t = seg.trim();
+                    if t.len() > 1 {
+                        if !text.is_empty() { text.push(' '); }
+                        text.push_str(t);
                     }
                 }
             }
-            let trimmed = text.trim().to_string();
-            if !trimmed.is_empty() {
-                tx_ui.send(AudioMessage::Transcription { text: trimmed, name: name.to_string() })?;
+            if !text.is_empty() {
+                tx_ui.send(AudioMessage::Transcription { text, name: name.clone() })?;
             }
         }
     }
@@ -378,47 +540,439 @@ fn process_and_send(
     Ok(())
 }
 
-#[cfg(not(target_os = "linux"))]
-fn to_mono(buf: &[f32], channels: usize) -> Vec<f32> {
-    buf.chunks(channels)
-        .map(|f| f.iter().sum::<f32>() / channels as f32)
-        .collect()
+/// Busca el dispositivo de captura por nombre. Devuelve también si es un
+/// dispositivo de reproducción: en Windows las fuentes de salida pueden serlo,
+/// y WASAPI las captura en modo loopback (por eventos, sin Stereo Mix) al
+/// abrir sobre ellas un stream de entrada.
+fn find_capture_device(
+    host: &Host,
+    name: &str,
+    source_type: SourceType,
+) -> Option<(cpal::Device, bool)> {
+    let matches = |d: &cpal::Device| {
+        d.description().map(|desc| desc.name() == name).unwrap_or(false)
+    };
+
+    #[cfg(target_os = "windows")]
+    if source_type == SourceType::Output {
+        if let Some(device) = host.output_devices().ok().and_then(|mut it| it.find(|d| matches(d))) {
+            return Some((device, true));
+        }
+    }
+    #[cfg(not(target_os = "windows"))]
+    let _ = source_type;
+
+    host.input_devices().ok()?.find(|d| matches(d)).map(|device| (device, false))
+}
+
+/// Configuración de captura más barata de procesar: si el dispositivo admite
+/// f32 a 16 kHz se pide así (mono si puede), y el callback no convierte ni
+/// hay que remuestrear. Si no, la configuración por defecto del driver.
+fn preferred_input_config(device: &cpal::Device) -> Result<cpal::SupportedStreamConfig> {
+    let native = device.supported_input_configs().ok().and_then(|configs| {
+        configs
+            .filter(|c| c.sample_format() == cpal::SampleFormat::F32
+                && u32::from(c.min_sample_rate()) <= WHISPER_SAMPLE_RATE
+                && u32::from(c.max_sample_rate()) >= WHISPER_SAMPLE_RATE)
+            .min_by_key(|c| c.channels())
+            .map(|c| c.with_sample_rate(WHISPER_SAMPLE_RATE.into()))
+    });
+
+    match native {
+        Some(config) => Ok(config),
+        None => Ok(device.default_input_config()?),
+    }
 }
 
-#[cfg(not(target_os = "linux"))]
-fn resample(input: &[f32], from: u32, to: u32) -> Vec<f32> {
+/// Abre el stream de entrada y la cola por la que llega su audio.
+///
+/// El callback corre en el hilo de tiempo real del driver: mezcla a mono,
+/// convierte a f32 y deja el bloque en una cola circular sin locks ni
+/// reservas de memoria. La cola tiene capacidad para un lote entero (30 s):
+/// si Whisper se queda atrás más de eso, se descartan las muestras nuevas.
+fn open_mono_input_stream(
+    device: &cpal::Device,
+    format: cpal::SampleFormat,
+    config: &cpal::StreamConfig,
+    name: &str,
+) -> Result<(cpal::Stream, RingConsumer)> {
+    let sample_rate = u32::from(config.sample_rate);
+    let (producer, consumer) = sample_ring(Windowing::at(sample_rate).max_batch);
+    let name = name.to_string();
+
+    let stream = match format {
+        cpal::SampleFormat::F32 => build_mono_input_stream::<f32>(
+            device, config, producer, name, |s| s),
+        cpal::SampleFormat::I16 => build_mono_input_stream::<i16>(
+            device, config, producer, name, |s| f32::from(s) * PCM16_SCALE),
+        cpal::SampleFormat::I32 => build_mono_input_stream::<i32>(
+            device, config, producer, name, |s| s as f32 * (1.0 / 2147483648.0)),
+        cpal::SampleFormat::U16 => build_mono_input_stream::<u16>(
+            device, config, producer, name, |s| (f32::from(s) - 32768.0) * PCM16_SCALE),
+        other => Err(anyhow!("Formato de muestra no soportado: {:?}", other)),
+    }?;
+    Ok((stream, consumer))
+}
+
+/// Abre un stream de entrada con muestras `T` cuyo callback mezcla a mono,
+/// convierte a f32 con `to_f32` y encola el resultado. El callback de tiempo
+/// real no reserva memoria.
+fn build_mono_input_stream<T: cpal::SizedSample>(
+    device: &cpal::Device,
+    config: &cpal::StreamConfig,
+    mut producer: RingProducer,
+    name: String,
+    to_f32: fn(T) -> f32,
+) -> Result<cpal::Stream> {
+    let channels = config.channels as usize;
+    let scale = 1.0 / channels as f32;
+
+    let stream = device.build_input_stream(
+        config,
+        // Cada frame se mezcla a mono al escribirlo en la cola: una sola
+        // publicación por callback y ninguna copia intermedia.
+        move |data: &[T], _: &cpal::InputCallbackInfo| {
+            producer.push_iter(data.chunks_exact(channels).map(|frame| {
+                frame.iter().map(|&s| to_f32(s)).sum::<f32>() * scale
+            }));
+        },
+        // Un error que se repite en cada callback (desbordamientos, por
+        // ejemplo) se imprime solo la primera vez seguida.
+        {
+            let mut last = None;
+            move |err: cpal::StreamError| {
+                let kind = std::mem::discriminant(&err);
+                if last.replace(kind) != Some(kind) {
+                    eprintln!("Error en stream [{}]: {}", name, err);
+                }
+            }
+        },
+        None,
+    )?;
+    Ok(stream)
+}
+
+/// Remuestrea `input` de `from` a `to` Hz por interpolación lineal y deja
+/// el resultado en `out`, que se vacía antes: el llamador reutiliza el mismo
+/// buffer en cada ventana.
+fn resample_into(input: &[f32], from: u32, to: u32, out: &mut Vec<f32>) {
     let ratio = to as f64 / from as f64;
     let len = (input.len() as f64 * ratio) as usize;
-    (0..len).map(|i| {
+    out.clear();
+    out.extend((0..len).map(|i| {
         let src = i as f64 / ratio;
         let idx = src as usize;
         let frac = (src - idx as f64) as f32;
         let a = input.get(idx).copied().unwrap_or(0.0);
         let b = input.get(idx + 1).copied().unwrap_or(0.0);
         a + (b - a) * frac
-    }).collect()
+    }));
 }
 
-fn normalize_audio(input: &[f32]) -> Vec<f32> {
-    let max = input.iter().map(|s| s.abs()).fold(0.0f32, f32::max);
-    if max < 0.0001 { return input.to_vec(); }
-    input.iter().map(|&s| s * (0.95 / max)).collect()
+/// Tamaños, en muestras a la frecuencia de captura, con los que los bucles
+/// de captura cortan el audio acumulado para Whisper.
+struct Windowing {
+    /// Audio mínimo para transcribir: una ventana.
+    target: usize,
+    /// Cola de cada lote que se conserva para abrir el siguiente.
+    overlap: usize,
+    /// Lo más que se pasa a Whisper de una vez (30 s).
+    max_batch: usize,
 }
 
-fn calculate_rms(audio: &[f32]) -> f32 {
-    let sum: f32 = audio.iter().map(|&s| s * s).sum();
-    (sum / audio.len() as f32).sqrt()
+impl Windowing {
+    fn at(sample_rate: u32) -> Self {
+        let target = (sample_rate * CHUNK_DURATION_SECS) as usize;
+        Self {
+            target,
+            overlap: target * CHUNK_OVERLAP_PERCENT / 100,
+            max_batch: (sample_rate * WHISPER_WINDOW_SECS) as usize,
+        }
+    }
+
+    /// Capacidad habitual del buffer acumulado: lo que queda de una ventana
+    /// más una cola llena.
+    fn capacity(&self) -> usize {
+        self.target + self.max_batch.next_power_of_two()
+    }
+
+    /// Muestras que faltan para completar la ventana.
+    fn missing(&self, accumulated: &[f32]) -> usize {
+        self.target.saturating_sub(accumulated.len())
+    }
+
+    /// Si hay al menos una ventana, pasa a `process` lo acumulado y lo
+    /// descarta salvo el solape. Si Whisper va con retraso se procesa todo
+    /// lo pendiente (hasta `max_batch`) en una pasada: el codificador rellena
+    /// siempre hasta 30 s, así que cuesta lo mismo que una ventana sola.
+    fn process_ready(
+        &self,
+        accumulated: &mut Vec<f32>,
+        process: impl FnOnce(&[f32]) -> Result<()>,
+    ) -> Result<()> {
+        if accumulated.len() < self.target {
+            return Ok(());
+        }
+        let batch = accumulated.len().min(self.max_batch);
+        process(&accumulated[..batch])?;
+        discard_processed(accumulated, batch, self.overlap);
+        Ok(())
+    }
+}
+
+/// Quita de `accumulated` las `processed` primeras muestras salvo sus
+/// últimas `overlap`, que abren la siguiente ventana. Lo pendiente se mueve
+/// al principio del mismo buffer en vez de crear otro: la capacidad se
+/// conserva y el bucle de captura no reserva memoria en cada ventana.
+fn discard_processed(accumulated: &mut Vec<f32>, processed: usize, overlap: usize) {
+    accumulated.drain(..processed.saturating_sub(overlap));
+}
+
+/// Si una ventana es silencio. El umbral se aplica al audio ya normalizado,
+/// pero su RMS es el RMS original por la ganancia: se decide sin copiar
+/// nada. Como la normalización sube el ruido de fondo de una sala en
+/// silencio hasta pasar ese umbral, se mira también el nivel original.
+fn is_silent_window(window: &[f32]) -> bool {
+    let (peak, rms) = peak_and_rms(window);
+    rms * normalization_gain(peak) < SILENCE_THRESHOLD || !has_voice_activity(window)
+}
+
+/// Ganancia que lleva el pico a 0.95. Ventanas casi mudas se dejan igual.
+fn normalization_gain(peak: f32) -> f32 {
+    if peak < 0.0001 { 1.0 } else { 0.95 / peak }
+}
+
+/// Si al menos `VOICE_MIN_FRAMES` tramos de 30 ms superan `VOICE_FRAME_RMS`.
+/// Se mira por tramos y no en media: en un fragmento largo una frase corta
+/// entre silencios apenas mueve el RMS total. Se deja de mirar en cuanto
+/// aparecen suficientes tramos.
+pub fn has_voice_activity(audio: &[f32]) -> bool {
+    const FRAME: usize = WHISPER_SAMPLE_RATE as usize * 30 / 1000;
+    let threshold = VOICE_FRAME_RMS * VOICE_FRAME_RMS * FRAME as f32;
+    audio.chunks(FRAME)
+        .filter(|frame| frame.iter().map(|&s| s * s).sum::<f32>() > threshold)
+        .take(VOICE_MIN_FRAMES)
+        .count() == VOICE_MIN_FRAMES
+}
+
+/// Pico absoluto y RMS de la ventana en una sola pasada.
+fn peak_and_rms(audio: &[f32]) -> (f32, f32) {
+    let (peak, sum) = audio.iter().fold((0.0f32, 0.0f32), |(peak, sum), &s| {
+        (peak.max(s.abs()), sum + s * s)
+    });
+    (peak, (sum / audio.len() as f32).sqrt())
+}
+
+// ── Procesos externos ─────────────────────────────────────────────────────
+
+/// Proceso hijo (parecord, ffmpeg) que se mata y se espera al salir de
+/// ámbito, también cuando se sale por un error: no quedan procesos
+/// capturando audio ni zombis tras detener o fallar una transcripción.
+pub struct ChildGuard(pub Child);
+
+impl Deref for ChildGuard {
+    type Target = Child;
+    fn deref(&self) -> &Child { &self.0 }
+}
+
+impl DerefMut for ChildGuard {
+    fn deref_mut(&mut self) -> &mut Child { &mut self.0 }
+}
+
+impl Drop for ChildGuard {
+    fn drop(&mut self) {
+        let _ = self.0.kill();
+        let _ = self.0.wait();
+    }
+}
+
+// ── Modelos cargados ───────────────────────────────────────────────────────
+
+/// Modelos que se mantienen en memoria entre sesiones. Volver a uno ya
+/// usado (de la captura en vivo al vídeo, o de "Medium" a "Large-v3" y
+/// vuelta) no vuelve a leer los pesos del disco.
+const LOADED_MODELS_CAP: usize = 2;
+
+/// Hueco de un modelo en la caché. Se llena con la primera carga; quien lo
+/// pide mientras tanto espera en su lock y recibe el mismo contexto.
+type ModelSlot = Arc<Mutex<Option<Arc<WhisperContext>>>>;
+
+/// Modelos cargados (o cargándose), del menos al más recientemente usado.
+static LOADED_MODELS: Mutex<Vec<(&'static str, ModelSlot)>> = Mutex::new(Vec::new());
+
+/// Devuelve el contexto de `model_name`. Si no está en memoria lo carga,
+/// descargándolo antes si no está en disco; `stop` cancela la descarga. Con
+/// la caché llena se saca el menos usado que ninguna sesión tenga; si todos
+/// están en uso, la caché crece hasta que alguno quede libre.
+pub fn load_whisper_context(model_name: &'static str, stop: &AtomicBool) -> Result<Arc<WhisperContext>> {
+    // El lock de la lista solo se mantiene para reservar el hueco; la carga
+    // va con el lock del hueco. Dos sesiones que piden el mismo modelo a la
+    // vez lo cargan una sola vez, y cargar uno no bloquea a quien pide otro.
+    let slot = {
+        let mut loaded = LOADED_MODELS.lock().unwrap_or_else(|e| e.into_inner());
+        match loaded.iter().position(|&(name, _)| name == model_name) {
+            Some(pos) => {
+                let entry = loaded.remove(pos);
+                let slot = entry.1.clone();
+                loaded.push(entry);
+                slot
+            }
+            None => {
+                // Uno en uso sigue en memoria de todas formas: sacarlo de la
+                // lista solo haría que la siguiente sesión que lo pida cargue
+                // otra copia de los pesos.
+                while loaded.len() >= LOADED_MODELS_CAP {
+                    match loaded.iter().position(|(_, slot)| is_idle(slot)) {
+                        Some(pos) => { loaded.remove(pos); }
+                        None => break,
+                    }
+                }
+                let slot = ModelSlot::default();
+                loaded.push((model_name, slot.clone()));
+                slot
+            }
+        }
+    };
+
+    // Quien tiene el hueco puede estar descargando o cargando el modelo
+    // durante minutos: se espera sondeando `stop` para que cancelar esta
+    // sesión no dependa de que termine la otra.
+    let mut cached = loop {
+        match slot.try_lock() {
+            Ok(cached) => break cached,
+            Err(TryLockError::Poisoned(e)) => break e.into_inner(),
+            Err(TryLockError::WouldBlock) => {
+                if stop.load(Ordering::SeqCst) {
+                    anyhow::bail!("Carga del modelo cancelada");
+                }
+                thread::sleep(STOP_POLL_INTERVAL);
+            }
+        }
+    };
+    if let Some(ctx) = cached.as_ref() {
+        return Ok(ctx.clone());
+    }
+    // Un modelo ya cargado no vuelve a mirar el disco. La descarga también
+    // va bajo el lock del hueco: dos sesiones no escriben a la vez el mismo
+    // `.part`. Si algo falla el hueco queda vacío y el siguiente lo reintenta.
+    let model_path = ensure_whisper_model(model_name, stop)?;
+    let mut ctx_params = WhisperContextParameters::default();
+    // En GPU la atención fusionada acelera el codificador y ocupa menos
+    // memoria de vídeo. En CPU no compensa.
+    ctx_params.flash_attn(cfg!(feature = "cuda"));
+    let ctx = Arc::new(
+        WhisperContext::new_with_params(&model_path, ctx_params)
+            .map_err(|e| anyhow!("Error cargando modelo: {:?}", e))?,
+    );
+    *cached = Some(ctx.clone());
+    Ok(ctx)
+}
+
+/// Si solo la caché tiene el hueco y su contexto: nadie lo está cargando
+/// ni transcribiendo con él. Se llama con el lock de la lista, sin el cual
+/// no se puede obtener otra referencia.
+fn is_idle(slot: &ModelSlot) -> bool {
+    Arc::strong_count(slot) == 1
+        && slot.try_lock().map_or(false, |ctx| {
+            ctx.as_ref().map_or(true, |ctx| Arc::strong_count(ctx) == 1)
+        })
+}
+
+/// Saca `model_name` de la caché si ninguna sesión lo está cargando ni
+/// transcribiendo con él. Si está ocupado se queda: sus pesos siguen en
+/// memoria de todas formas mientras alguien lo use.
+pub fn evict_idle_model(model_name: &str) {
+    let mut loaded = LOADED_MODELS.lock().unwrap_or_else(|e| e.into_inner());
+    if let Some(pos) = loaded.iter().position(|(name, slot)| *name == model_name && is_idle(slot)) {
+        loaded.remove(pos);
+    }
+}
+
+/// Si `model_name` ya está en la caché o alguien lo está cargando.
+pub fn is_model_loaded(model_name: &str) -> bool {
+    let loaded = LOADED_MODELS.lock().unwrap_or_else(|e| e.into_inner());
+    loaded.iter().any(|(name, slot)| {
+        *name == model_name && slot.try_lock().map_or(true, |ctx| ctx.is_some())
+    })
+}
+
+/// Hilos de cómputo de la pasada de calentamiento: corre al abrir la app o
+/// al cambiar de modelo, mientras el usuario interactúa con la UI.
+const WARM_UP_THREADS: i32 = 2;
+
+/// Carga `model_name` en la caché y le pasa un segundo de silencio (lo
+/// mínimo que acepta whisper.cpp) en un estado desechable, para que la
+/// primera sesión no pague leer los pesos ni las reservas del backend. No
+/// descarga nada: sin el modelo en disco no hace nada.
+///
+/// `cancel` se activa cuando el usuario elige otro modelo: si llega a
+/// tiempo la carga se abandona y, si no, el modelo se saca de la caché al
+/// terminar en vez de quedarse ocupando un hueco.
+pub fn warm_up_whisper_model(model_name: &'static str, cancel: &AtomicBool) {
+    let model_path = Path::new(MODELS_DIR).join(model_file_name(model_name));
+    if !model_path.exists() {
+        return;
+    }
+    if let Ok(ctx) = load_whisper_context(model_name, cancel) {
+        if let Ok(mut state) = ctx.create_state() {
+            let mut params = transcription_params(&LanguageConfig::default());
+            params.set_n_threads(WARM_UP_THREADS);
+            let silence = vec![0.0f32; WHISPER_SAMPLE_RATE as usize];
+            let _ = state.full(params, &silence);
+        }
+    }
+    if cancel.load(Ordering::SeqCst) {
+        evict_idle_model(model_name);
+    }
 }
 
 // ── Descarga del modelo ────────────────────────────────────────────────────
 
-pub async fn download_whisper_model(model_name: &str) -> Result<String> {
-    let models_dir = Path::new("models");
-    let model_file = format!("ggml-{}.bin", model_name);
+/// Runtime de tokio compartido por todas las descargas. Antes se creaba uno
+/// nuevo (con su pool de hilos) en cada sesión solo para un `block_on`.
+///
+/// Es de un solo hilo: la descarga es una única petición que se conduce
+/// desde el propio `block_on`, y un pool de un hilo por núcleo solo
+/// añadiría hilos ociosos y saltos entre ellos. Varios hilos pueden hacer
+/// `block_on` a la vez; se turnan para conducir el runtime.
+static RUNTIME: OnceLock<Runtime> = OnceLock::new();
+
+fn shared_runtime() -> Result<&'static Runtime> {
+    if let Some(rt) = RUNTIME.get() {
+        return Ok(rt);
+    }
+    let rt = Builder::new_current_thread().enable_all().build()?;
+    Ok(RUNTIME.get_or_init(|| rt))
+}
+
+const MODELS_DIR: &str = "models";
+
+fn model_file_name(model_name: &str) -> String {
+    format!("ggml-{}.bin", model_name)
+}
+
+/// Versión bloqueante de `download_whisper_model` para los hilos de trabajo.
+/// Si el modelo ya está en disco (lo habitual) responde sin pasar por el
+/// runtime de tokio, que solo se crea la primera vez que hay que descargar.
+pub fn ensure_whisper_model(model_name: &str, stop: &AtomicBool) -> Result<String> {
+    let model_path = Path::new(MODELS_DIR).join(model_file_name(model_name));
+    if model_path.exists() {
+        return Ok(model_path.to_string_lossy().to_string());
+    }
+    shared_runtime()?.block_on(download_whisper_model(model_name, stop))
+}
+
+/// Descarga `model_name` si no está en disco. Si se activa `stop` la
+/// descarga se abandona (en menos de `STOP_POLL_INTERVAL` aunque la red no
+/// entregue nada) y se borra lo descargado: cerrar la ventana o detener la
+/// sesión no espera a varios GB.
+pub async fn download_whisper_model(model_name: &str, stop: &AtomicBool) -> Result<String> {
+    let models_dir = Path::new(MODELS_DIR);
+    let model_file = model_file_name(model_name);
     let model_path = models_dir.join(&model_file);
 
     if !models_dir.exists() {
-        std::fs::create_dir_all(models_dir)?;
+        tokio::fs::create_dir_all(models_dir).await?;
     }
 
     if model_path.exists() {
@@ -441,21 +995,132 @@ pub async fn download_whisper_model(model_name: &str) -> Result<String> {
 
     let total = response.content_length().unwrap_or(0);
     let mut downloaded: u64 = 0;
-    let mut file = std::fs::File::create(&model_path)?;
+    // Escritura asíncrona y con buffer: no bloquear el runtime en cada trozo
+    // recibido. Se descarga a un `.part` y se renombra al terminar, para que
+    // una descarga interrumpida no deje un modelo truncado que luego se
+    // daría por válido.
+    let part_path = models_dir.join(format!("{}.part", model_file));
+    let mut file = tokio::io::BufWriter::with_capacity(
+        1 << 20,
+        tokio::fs::File::create(&part_path).await?,
+    );
     let mut stream = response.bytes_stream();
+    // El progreso se imprime al cambiar la décima de porcentaje, no en cada
+    // trozo recibido (miles de escrituras a la consola por modelo).
+    let mut last_permille = None;
 
-    while let Some(chunk) = stream.next().await {
-        let chunk = chunk?;
-        file.write_all(&chunk)?;
+    loop {
+        if stop.load(Ordering::SeqCst) {
+            drop(file);
+            let _ = tokio::fs::remove_file(&part_path).await;
+            anyhow::bail!("Descarga del modelo cancelada");
+        }
+        let chunk = match tokio::time::timeout(STOP_POLL_INTERVAL, stream.next()).await {
+            Ok(Some(chunk)) => chunk?,
+            Ok(None) => break,
+            Err(_) => continue,
+        };
+        file.write_all(&chunk).await?;
         downloaded += chunk.len() as u64;
         if total > 0 {
-            print!("\r   {:.1}% ({}/{} MB)",
-                (downloaded as f64 / total as f64) * 100.0,
-                downloaded / 1_000_000, total / 1_000_000);
-            std::io::stdout().flush()?;
+            let permille = downloaded * 1000 / total;
+            if last_permille != Some(permille) {
+                last_permille = Some(permille);
+                print!("\r   {:.1}% ({}/{} MB)",
+                    permille as f64 / 10.0,
+                    downloaded / 1_000_000, total / 1_000_000);
+                std::io::stdout().flush()?;
+            }
         }
     }
 
+    file.flush().await?;
+    drop(file);
+    tokio::fs::rename(&part_path, &model_path).await?;
+
     println!("\n✓ Modelo descargado");
     Ok(model_path.to_string_lossy().to_string())
-}
\ No newline at end of file
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    #[cfg(target_os = "linux")]
+    use crate::test_util::Trickle;
+
+    /// Tramo de 30 ms a 16 kHz.
+    const FRAME: usize = WHISPER_SAMPLE_RATE as usize * 30 / 1000;
+
+    #[cfg(target_os = "linux")]
+    #[test]
+    fn parecord_reader_rejoins_samples_split_across_reads() {
+        let samples: Vec<f32> = (0..100).map(|i| i as f32 / 100.0 - 0.5).collect();
+        let bytes: Vec<u8> = samples.iter().flat_map(|s| s.to_le_bytes()).collect();
+        // Trozos que no son múltiplo de 4: cada muestra puede quedar partida
+        let stdout = Trickle::new(&bytes, &[3, 5, 1, 7, 2]);
+
+        let (producer, mut consumer) = sample_ring(samples.len());
+        assert!(read_parecord_pipe(stdout, producer).unwrap());
+
+        let mut out = Vec::new();
+        consumer.pop_into(&mut out);
+        assert_eq!(out, samples);
+    }
+
+    #[cfg(target_os = "linux")]
+    #[test]
+    fn parecord_reader_reports_an_empty_pipe() {
+        let stdout = Trickle::new(&[], &[1]);
+        let (producer, _consumer) = sample_ring(16);
+        assert!(!read_parecord_pipe(stdout, producer).unwrap());
+    }
+
+    #[test]
+    fn discard_processed_keeps_overlap_and_unprocessed_tail() {
+        let mut accumulated: Vec<f32> = (0..10).map(|i| i as f32).collect();
+        discard_processed(&mut accumulated, 6, 2);
+        assert_eq!(accumulated, [4.0, 5.0, 6.0, 7.0, 8.0, 9.0]);
+
+        // Un solape mayor que lo procesado no descarta nada
+        discard_processed(&mut accumulated, 1, 3);
+        assert_eq!(accumulated.len(), 6);
+    }
+
+    #[test]
+    fn process_ready_waits_for_a_window_and_caps_the_batch() {
+        let windows = Windowing { target: 4, overlap: 1, max_batch: 6 };
+        let mut accumulated = vec![0.0; 3];
+        windows.process_ready(&mut accumulated, |_| panic!("ventana incompleta")).unwrap();
+        assert_eq!(windows.missing(&accumulated), 1);
+
+        let mut accumulated: Vec<f32> = (0..9).map(|i| i as f32).collect();
+        let mut seen = 0;
+        windows.process_ready(&mut accumulated, |batch| {
+            seen = batch.len();
+            Ok(())
+        }).unwrap();
+        assert_eq!(seen, 6);
+        assert_eq!(accumulated, [5.0, 6.0, 7.0, 8.0]);
+    }
+
+    #[test]
+    fn voice_activity_needs_several_loud_frames() {
+        let mut audio = vec![0.0f32; 50 * FRAME];
+        assert!(!has_voice_activity(&audio));
+
+        // Un clic aislado no es voz
+        audio[10 * FRAME..11 * FRAME].fill(0.3);
+        assert!(!has_voice_activity(&audio));
+
+        audio[20 * FRAME..22 * FRAME].fill(0.3);
+        assert!(has_voice_activity(&audio));
+    }
+
+    #[test]
+    fn voice_activity_ignores_background_noise() {
+        let hum: Vec<f32> = (0..50 * FRAME)
+            .map(|i| if i % 2 == 0 { 0.002 } else { -0.002 })
+            .collect();
+        assert!(!has_voice_activity(&hum));
+    }
+}
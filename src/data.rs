@@ -1,10 +1,24 @@
-use std::sync::mpsc::Sender;
+use eframe::egui;
+use std::sync::atomic::{fence, AtomicBool, Ordering};
+use std::sync::mpsc::{channel, Receiver, SendError, Sender, TryRecvError};
+use std::borrow::Cow;
+use std::sync::Arc;
 pub const WHISPER_SAMPLE_RATE: u32 = 16000;
 pub const CHUNK_DURATION_SECS: u32 = 5; 
 pub const SILENCE_THRESHOLD: f32 = 0.1; 
+/// Nivel RMS (unos -46 dBFS) por debajo del cual un tramo de 30 ms se
+/// considera silencio.
+pub const VOICE_FRAME_RMS: f32 = 0.005;
+/// Tramos de 30 ms por encima de `VOICE_FRAME_RMS` que necesita un fragmento
+/// para transcribirse. Un clic o un golpe en la mesa ocupa uno; hasta la
+/// palabra más corta ocupa varios.
+pub const VOICE_MIN_FRAMES: usize = 3;
+/// Porcentaje de cada ventana que se conserva para la siguiente, para no
+/// cortar palabras en la frontera entre ventanas.
+pub const CHUNK_OVERLAP_PERCENT: usize = 30;
 
 // Tipos de fuente de audio
-#[derive(Clone, Debug, PartialEq)]
+#[derive(Clone, Copy, Debug, PartialEq)]
 pub enum SourceType {
     Input,
     Output,
@@ -29,8 +43,9 @@ pub struct InterlocutorProfile {
     pub technical_name: Option<String>,
 }
 
-// Configuración de idioma global para la sesión
-#[derive(Clone, Debug, PartialEq)]
+// Configuración de idioma global para la sesión. Es `Copy` (un puntero y un
+// bool): cada hilo recibe su copia sin clonar nada en el heap.
+#[derive(Clone, Copy, Debug, PartialEq)]
 pub struct LanguageConfig {
     /// None = autodetección. Some("en"), Some("es"), etc.
     pub source_lang: Option<&'static str>,
@@ -51,27 +66,36 @@ impl LanguageConfig {
     pub fn source_label(&self) -> &'static str {
         match self.source_lang {
             None => "Auto",
-            Some("en") => "English",
-            Some("es") => "Español",
-            Some("fr") => "Français",
-            Some("de") => "Deutsch",
-            Some("it") => "Italiano",
-            Some("pt") => "Português",
-            Some("zh") => "中文",
-            Some("ja") => "日本語",
-            Some(other) => other,
+            Some(code) => SOURCE_LANGUAGES.iter()
+                .find(|&&(_, c)| c == Some(code))
+                .map_or(code, |&(label, _)| label),
         }
     }
 
     pub fn dest_label(&self) -> &'static str {
-        if self.translate_to_english {
-            "English (traducir)"
-        } else {
-            "Original (sin traducción)"
-        }
+        DEST_LANGUAGES.iter()
+            .find(|&&(_, translate)| translate == self.translate_to_english)
+            .map_or("", |&(label, _)| label)
     }
 }
 
+/// Modelos de Whisper que ofrece la UI: (etiqueta, nombre en el repositorio
+/// de whisper.cpp). Para añadir uno basta con una entrada aquí.
+pub const WHISPER_MODELS: &[(&str, &str)] = &[
+    ("Medium",         "medium"),
+    ("Large-v3",       "large-v3"),
+    // Decodificador de 4 capas en vez de 32: varias veces más rápido que
+    // large-v3 con una precisión muy parecida. El más indicado en tiempo real.
+    ("Large-v3 Turbo", "large-v3-turbo"),
+    // Pesos cuantizados a 5 y 8 bits: de un tercio a la mitad del tamaño y
+    // más rápidos en CPU, con una pérdida de precisión pequeña.
+    ("Large-v3 Turbo Q5", "large-v3-turbo-q5_0"),
+    ("Large-v3 Turbo Q8", "large-v3-turbo-q8_0"),
+    ("Medium Q5",         "medium-q5_0"),
+];
+
+pub const DEFAULT_WHISPER_MODEL: &str = "large-v3";
+
 pub const SOURCE_LANGUAGES: &[(&str, Option<&'static str>)] = &[
     ("Auto (detectar)", None),
     ("English",         Some("en")),
@@ -84,18 +108,27 @@ pub const SOURCE_LANGUAGES: &[(&str, Option<&'static str>)] = &[
     ("日本語",          Some("ja")),
 ];
 
-// Mensajes de comunicación entre el hilo de audio y la UI
+/// Opciones de idioma destino: (etiqueta, traducir al inglés). Whisper solo
+/// sabe traducir a inglés.
+pub const DEST_LANGUAGES: &[(&str, bool)] = &[
+    ("Original (sin traducción)", false),
+    ("English (traducir)",        true),
+];
+
+// Mensajes de comunicación entre el hilo de audio y la UI. Los estados
+// son casi siempre textos fijos: `Cow` los envía sin reservar memoria. El
+// nombre del interlocutor se comparte: cada stream lo copia una sola vez.
 pub enum AudioMessage {
-    Status(String),
-    Transcription { text: String, name: String },
+    Status(Cow<'static, str>),
+    Transcription { text: String, name: Arc<str> },
     Error(String),
 }
 
 // Mensajes del hilo de transcripción de vídeo
 pub enum VideoMessage {
-    Status(String),
+    Status(Cow<'static, str>),
     Progress(f32),                         // 0.0 – 1.0
-    Segment { timestamp: String, text: String },
+    Segments(String),                      // líneas "[mm:ss] texto\n" de un fragmento
     Done,
     Error(String),
 }
@@ -108,5 +141,71 @@ pub enum View {
     Settings,
 }
 
-// Alias para el canal de comunicación de la UI
-pub type UiSender = Sender<AudioMessage>;
\ No newline at end of file
+// Canal de los hilos de trabajo hacia la UI. Los envíos despiertan a egui,
+// así los mensajes se pintan en cuanto llegan en vez de esperar a un
+// sondeo periódico. Una ráfaga de mensajes (estado, progreso, texto)
+// produce un solo despertar: solo despierta el primer envío tras vaciar
+// la UI la cola. Al soltarse el emisor también la despierta, para que la
+// UI vea el canal cerrado cuando termina el último hilo.
+pub struct WakingSender<T> {
+    tx: Sender<T>,
+    ctx: egui::Context,
+    /// Hay mensajes sin leer y la UI ya fue despertada por ellos.
+    pending: Arc<AtomicBool>,
+}
+
+pub struct WakingReceiver<T> {
+    rx: Receiver<T>,
+    pending: Arc<AtomicBool>,
+}
+
+pub fn waking_channel<T>(ctx: &egui::Context) -> (WakingSender<T>, WakingReceiver<T>) {
+    let (tx, rx) = channel();
+    let pending = Arc::new(AtomicBool::new(false));
+    (
+        WakingSender { tx, ctx: ctx.clone(), pending: pending.clone() },
+        WakingReceiver { rx, pending },
+    )
+}
+
+impl<T> WakingSender<T> {
+    pub fn send(&self, msg: T) -> Result<(), SendError<T>> {
+        let result = self.tx.send(msg);
+        fence(Ordering::SeqCst);
+        if !self.pending.swap(true, Ordering::Relaxed) {
+            self.ctx.request_repaint();
+        }
+        result
+    }
+}
+
+impl<T> WakingReceiver<T> {
+    pub fn try_recv(&self) -> Result<T, TryRecvError> {
+        match self.rx.try_recv() {
+            // Cola vacía: se rearma el despertar y se mira una vez más, por
+            // si un envío llegó justo antes de rearmarlo.
+            Err(TryRecvError::Empty) => {
+                self.pending.store(false, Ordering::Relaxed);
+                fence(Ordering::SeqCst);
+                self.rx.try_recv()
+            }
+            other => other,
+        }
+    }
+}
+
+impl<T> Clone for WakingSender<T> {
+    fn clone(&self) -> Self {
+        Self { tx: self.tx.clone(), ctx: self.ctx.clone(), pending: self.pending.clone() }
+    }
+}
+
+impl<T> Drop for WakingSender<T> {
+    fn drop(&mut self) {
+        self.ctx.request_repaint();
+    }
+}
+
+// Alias para los canales de comunicación de la UI
+pub type UiSender = WakingSender<AudioMessage>;
+pub type VideoSender = WakingSender<VideoMessage>;
\ No newline at end of file
@@ -3,13 +3,24 @@ mod audio;
 mod ui;
 mod video;
 mod system_audio;
+mod ring;
+#[cfg(test)]
+mod test_util;
 use anyhow::Result;
 use eframe::egui;
 use crate::ui::TranscriptorApp;
 use std::env;
 
 fn main() -> Result<()> {
-    env::set_var("ALSA_CONFIG_PATH", "/dev/null");
+    // Con PulseAudio/PipeWire no usamos ALSA directamente: se silencia su
+    // configuración. Sin ellos, ALSA es la ruta de captura de respaldo.
+    if !cfg!(target_os = "linux") || system_audio::pulse_available() {
+        env::set_var("ALSA_CONFIG_PATH", "/dev/null");
+    }
+
+    // whisper.cpp y GGML escriben varias líneas de log por cada ventana
+    // transcrita: se descartan en origen en vez de llegar a stderr.
+    whisper_rs::install_logging_hooks();
 
     #[cfg(target_os = "linux")]
     {
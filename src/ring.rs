@@ -0,0 +1,198 @@
+use std::sync::atomic::{fence, AtomicBool, AtomicU32, AtomicUsize, Ordering};
+use std::sync::Arc;
+use std::thread::{self, Thread};
+use std::time::Duration;
+
+// Cola circular de muestras con un único productor (el callback del driver
+// de audio) y un único consumidor (el hilo que alimenta a Whisper).
+//
+// No usa locks ni reserva memoria después de crearse: las muestras se
+// guardan como bits de f32 en atómicos y los índices `head`/`tail` crecen
+// de forma monótona (se enmascaran al indexar). Si la cola se llena, las
+// muestras nuevas se descartan.
+
+struct Shared {
+    slots: Box<[AtomicU32]>,
+    /// Próxima posición a leer. Solo la avanza el consumidor.
+    head: AtomicUsize,
+    /// Próxima posición a escribir. Solo la avanza el productor.
+    tail: AtomicUsize,
+    /// El consumidor está (o va a estar) dormido esperando datos. El
+    /// productor solo llama a `unpark` cuando lo ve activo.
+    parked: AtomicBool,
+    /// Muestras que el consumidor necesita antes de que valga la pena
+    /// despertarlo.
+    wanted: AtomicUsize,
+}
+
+pub struct RingProducer {
+    shared: Arc<Shared>,
+    mask: usize,
+    consumer: Thread,
+}
+
+pub struct RingConsumer {
+    shared: Arc<Shared>,
+    mask: usize,
+}
+
+/// Crea una cola con capacidad para al menos `min_capacity` muestras
+/// (se redondea a potencia de dos). Debe llamarse desde el hilo consumidor:
+/// el productor lo despierta con `unpark` cuando está esperando datos.
+pub fn sample_ring(min_capacity: usize) -> (RingProducer, RingConsumer) {
+    let capacity = min_capacity.max(1).next_power_of_two();
+    let shared = Arc::new(Shared {
+        slots: (0..capacity).map(|_| AtomicU32::new(0)).collect(),
+        head: AtomicUsize::new(0),
+        tail: AtomicUsize::new(0),
+        parked: AtomicBool::new(false),
+        wanted: AtomicUsize::new(0),
+    });
+    let mask = capacity - 1;
+
+    (
+        RingProducer { shared: shared.clone(), mask, consumer: thread::current() },
+        RingConsumer { shared, mask },
+    )
+}
+
+impl RingProducer {
+    /// Escribe las muestras que quepan y despierta al consumidor si está
+    /// dormido y ya hay tantas como pidió. Devuelve cuántas se escribieron.
+    ///
+    /// Las muestras se generan según se escriben: quien convierte o mezcla
+    /// el audio lo deja directamente en la cola, sin buffer intermedio. Lo
+    /// que no quepa no se llega a consumir del iterador.
+    pub fn push_iter(&mut self, samples: impl Iterator<Item = f32>) -> usize {
+        let tail = self.shared.tail.load(Ordering::Relaxed);
+        let head = self.shared.head.load(Ordering::Acquire);
+        let free = self.shared.slots.len() - tail.wrapping_sub(head);
+
+        let mut n = 0;
+        for s in samples.take(free) {
+            self.shared.slots[tail.wrapping_add(n) & self.mask].store(s.to_bits(), Ordering::Relaxed);
+            n += 1;
+        }
+
+        self.shared.tail.store(tail.wrapping_add(n), Ordering::Release);
+
+        // Varias escrituras seguidas producen un solo despertar: el resto
+        // de bloques se recoge en la misma pasada del consumidor. `head`
+        // puede estar desfasado, pero solo hacia atrás: a lo sumo se
+        // despierta antes de tiempo, nunca se pierde un despertar.
+        fence(Ordering::SeqCst);
+        let ready = tail.wrapping_add(n).wrapping_sub(head) >= self.shared.wanted.load(Ordering::Relaxed);
+        if ready && self.shared.parked.swap(false, Ordering::Relaxed) {
+            self.consumer.unpark();
+        }
+        n
+    }
+}
+
+impl RingConsumer {
+    /// Espera a que haya al menos `min` muestras (como mínimo una), como
+    /// mucho `timeout`. Con `min` grande el productor no despierta al
+    /// consumidor en cada bloque del driver, sino una vez por ventana.
+    pub fn wait_for(&self, min: usize, timeout: Duration) {
+        let min = min.clamp(1, self.shared.slots.len());
+        // Se anuncia antes de comprobar la cola: si el productor escribe
+        // entre medias verá `parked` y nos despertará.
+        self.shared.wanted.store(min, Ordering::Relaxed);
+        self.shared.parked.store(true, Ordering::Relaxed);
+        fence(Ordering::SeqCst);
+        if self.available() < min {
+            thread::park_timeout(timeout);
+        }
+        self.shared.parked.store(false, Ordering::Relaxed);
+    }
+
+    pub fn available(&self) -> usize {
+        let head = self.shared.head.load(Ordering::Relaxed);
+        self.shared.tail.load(Ordering::Acquire).wrapping_sub(head)
+    }
+
+    /// Añade al final de `out` todas las muestras disponibles.
+    /// Devuelve cuántas se leyeron.
+    pub fn pop_into(&mut self, out: &mut Vec<f32>) -> usize {
+        let head = self.shared.head.load(Ordering::Relaxed);
+        let tail = self.shared.tail.load(Ordering::Acquire);
+        let n = tail.wrapping_sub(head);
+
+        out.extend((0..n).map(|i| {
+            f32::from_bits(self.shared.slots[head.wrapping_add(i) & self.mask].load(Ordering::Relaxed))
+        }));
+
+        self.shared.head.store(tail, Ordering::Release);
+        n
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use std::time::Instant;
+
+    #[test]
+    fn wraps_around_past_the_mask() {
+        let (mut producer, mut consumer) = sample_ring(4);
+        let mut out = Vec::new();
+        // Varias vueltas completas: los índices pasan de la capacidad y se
+        // enmascaran al escribir y al leer.
+        for round in 0..5 {
+            let base = round as f32 * 10.0;
+            assert_eq!(producer.push_iter((0..3).map(|i| base + i as f32)), 3);
+            out.clear();
+            assert_eq!(consumer.pop_into(&mut out), 3);
+            assert_eq!(out, [base, base + 1.0, base + 2.0]);
+        }
+    }
+
+    #[test]
+    fn overflow_keeps_oldest_and_returns_short_count() {
+        let (mut producer, mut consumer) = sample_ring(4);
+        assert_eq!(producer.push_iter([1.0, 2.0, 3.0].into_iter()), 3);
+        assert_eq!(producer.push_iter([4.0, 5.0, 6.0].into_iter()), 1);
+        assert_eq!(producer.push_iter([7.0].into_iter()), 0);
+
+        let mut out = Vec::new();
+        assert_eq!(consumer.pop_into(&mut out), 4);
+        assert_eq!(out, [1.0, 2.0, 3.0, 4.0]);
+    }
+
+    #[test]
+    fn pop_into_appends_in_fifo_order() {
+        let (mut producer, mut consumer) = sample_ring(8);
+        let mut out = vec![-1.0];
+        producer.push_iter([1.0, 2.0].into_iter());
+        producer.push_iter([3.0].into_iter());
+        assert_eq!(consumer.available(), 3);
+        assert_eq!(consumer.pop_into(&mut out), 3);
+        assert_eq!(out, [-1.0, 1.0, 2.0, 3.0]);
+        assert_eq!(consumer.available(), 0);
+        assert_eq!(consumer.pop_into(&mut out), 0);
+    }
+
+    #[test]
+    fn push_iter_wakes_a_waiting_consumer() {
+        const MIN: usize = 64;
+        const TIMEOUT: Duration = Duration::from_secs(10);
+
+        let (mut producer, consumer) = sample_ring(1024);
+        let writer = thread::spawn(move || {
+            // Bloques más pequeños que lo pedido: solo el que lo completa
+            // debe despertar al consumidor.
+            for _ in 0..MIN / 16 {
+                thread::sleep(Duration::from_millis(5));
+                producer.push_iter(std::iter::repeat(0.5).take(16));
+            }
+        });
+
+        let start = Instant::now();
+        while consumer.available() < MIN && start.elapsed() < TIMEOUT {
+            consumer.wait_for(MIN, TIMEOUT);
+        }
+        assert!(consumer.available() >= MIN);
+        assert!(start.elapsed() < TIMEOUT / 2, "wait_for no se despertó con push_iter");
+        writer.join().unwrap();
+    }
+}
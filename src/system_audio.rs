@@ -1,5 +1,6 @@
 use anyhow::Result;
 use cpal::traits::{DeviceTrait, HostTrait};
+use std::sync::OnceLock;
 use crate::data::DeviceInfo;
 
 #[derive(Debug, Clone, PartialEq)]
@@ -18,19 +19,29 @@ pub struct LoopbackInfo {
     pub loopback_devices: Vec<DeviceInfo>,
 }
 
-pub fn detect_os() -> &'static str {
-    if cfg!(target_os = "windows") { "windows" }
-    else if cfg!(target_os = "linux") { "linux" }
-    else if cfg!(target_os = "macos") { "macos" }
-    else { "unknown" }
+#[derive(Debug, Clone, Copy, PartialEq)]
+pub enum Platform {
+    Windows,
+    Linux,
+    MacOs,
+    Unknown,
+}
+
+/// Plataforma de compilación, resuelta en tiempo de compilación: los
+/// `match` sobre ella se reducen a una sola rama.
+pub const fn detect_os() -> Platform {
+    if cfg!(target_os = "windows") { Platform::Windows }
+    else if cfg!(target_os = "linux") { Platform::Linux }
+    else if cfg!(target_os = "macos") { Platform::MacOs }
+    else { Platform::Unknown }
 }
 
 pub fn check_loopback_status() -> Result<LoopbackInfo> {
     match detect_os() {
-        "windows" => Ok(check_windows_loopback()),
-        "linux"   => Ok(check_linux_loopback()),
-        "macos"   => Ok(check_macos_loopback()),
-        _ => Ok(LoopbackInfo {
+        Platform::Windows => Ok(check_windows_loopback()),
+        Platform::Linux   => Ok(check_linux_loopback()),
+        Platform::MacOs   => Ok(check_macos_loopback()),
+        Platform::Unknown => Ok(LoopbackInfo {
             status: LoopbackStatus::Unsupported,
             message: "Sistema operativo no soportado".to_string(),
             instructions: vec![],
@@ -41,9 +52,10 @@ pub fn check_loopback_status() -> Result<LoopbackInfo> {
 
 // ── Windows ───────────────────────────────────────────────────────────────
 //
-// En WASAPI, los dispositivos loopback (Stereo Mix, What U Hear…)
-// aparecen directamente en la lista de inputs de cpal cuando están
-// habilitados en el Panel de Sonido. No necesitamos PowerShell.
+// WASAPI captura en modo loopback cualquier dispositivo de reproducción:
+// cpal lo hace al abrir un stream de entrada sobre un output. Además, los
+// dispositivos loopback clásicos (Stereo Mix, What U Hear…) aparecen en la
+// lista de inputs de cpal cuando están habilitados en el Panel de Sonido.
 
 fn check_windows_loopback() -> LoopbackInfo {
     let devices = get_windows_loopback_devices();
@@ -62,18 +74,15 @@ fn check_windows_loopback() -> LoopbackInfo {
     } else {
         LoopbackInfo {
             status: LoopbackStatus::NeedsConfiguration,
-            message: "⚠️ No se detecta 'Stereo Mix' u otro dispositivo loopback".to_string(),
+            message: "⚠️ No se detecta ningún dispositivo de reproducción".to_string(),
             instructions: vec![
-                "Para capturar el audio del sistema en Windows:".into(),
-                "".into(),
-                "1. Click derecho en el icono de volumen (barra de tareas)".into(),
-                "2. Selecciona 'Configuración de sonido' → 'Más opciones de sonido'".into(),
-                "3. Pestaña 'Grabación' → click derecho → 'Mostrar dispositivos deshabilitados'".into(),
-                "4. Busca 'Mezcla estéreo' o 'Stereo Mix' → click derecho → 'Habilitar'".into(),
+                "El audio del sistema se captura desde un dispositivo de reproducción".into(),
+                "(altavoces o auriculares), y Windows no informa de ninguno activo.".into(),
                 "".into(),
-                "Si no aparece Stereo Mix, tu tarjeta de sonido no lo soporta.".into(),
-                "Alternativa: instala 'VB-Audio Virtual Cable' (gratuito):".into(),
-                "  https://vb-audio.com/Cable/".into(),
+                "1. Conecta o activa unos altavoces o auriculares".into(),
+                "2. Click derecho en el icono de volumen → 'Configuración de sonido'".into(),
+                "   y comprueba que hay un dispositivo de salida habilitado".into(),
+                "3. Pulsa 'Actualizar Dispositivos'".into(),
             ],
             loopback_devices: vec![],
         }
@@ -81,12 +90,39 @@ fn check_windows_loopback() -> LoopbackInfo {
 }
 
 fn get_windows_loopback_devices() -> Vec<DeviceInfo> {
+    let mut devices = enumerate_render_devices();
+
     // WASAPI expone Stereo Mix / What U Hear / Wave Out Mix como inputs normales
-    enumerate_loopback_inputs(&[
+    for dev in enumerate_loopback_inputs(&[
         "stereo mix", "mezcla estéreo", "what u hear",
         "wave out mix", "loopback", "virtual cable", "vb-audio",
         "cable output", // VB-Audio Cable
-    ])
+    ]) {
+        devices.push(DeviceInfo { id: devices.len(), ..dev });
+    }
+
+    devices
+}
+
+/// Dispositivos de reproducción, capturables en modo loopback con WASAPI.
+fn enumerate_render_devices() -> Vec<DeviceInfo> {
+    let host = cpal::default_host();
+    let mut devices = vec![];
+
+    if let Ok(outputs) = host.output_devices() {
+        for device in outputs {
+            if let Ok(desc) = device.description() {
+                let name = desc.name().to_string();
+                devices.push(DeviceInfo {
+                    id: devices.len(),
+                    name: format!("{} (loopback)", name),
+                    technical_name: Some(name),
+                });
+            }
+        }
+    }
+
+    devices
 }
 
 // ── Linux ─────────────────────────────────────────────────────────────────
@@ -94,6 +130,10 @@ fn get_windows_loopback_devices() -> Vec<DeviceInfo> {
 fn check_linux_loopback() -> LoopbackInfo {
     use std::process::Command;
 
+    if !pulse_available() {
+        return check_alsa_loopback();
+    }
+
     let audio_sys = {
         let out = Command::new("pactl").args(&["info"]).output().ok();
         out.and_then(|o| String::from_utf8(o.stdout).ok())
@@ -130,46 +170,111 @@ fn check_linux_loopback() -> LoopbackInfo {
 }
 
 pub fn get_linux_loopback_devices() -> Vec<DeviceInfo> {
-    use std::process::Command;
+    if !pulse_available() {
+        return get_alsa_loopback_devices();
+    }
 
-    let mut devices = vec![];
+    list_pulse_sources()
+        .into_iter()
+        .filter(|(tech_name, _)| tech_name.contains(".monitor") || tech_name.contains("Monitor"))
+        .enumerate()
+        .map(|(id, (tech_name, description))| DeviceInfo {
+            id,
+            name: description,
+            technical_name: Some(tech_name),
+        })
+        .collect()
+}
 
-    let output = Command::new("pactl").args(&["list", "sources", "short"]).output();
-
-    if let Ok(out) = output {
-        let sources = String::from_utf8_lossy(&out.stdout);
-
-        for line in sources.lines() {
-            let parts: Vec<&str> = line.split_whitespace().collect();
-            if parts.len() < 2 { continue; }
-            let tech_name = parts[1].to_string();
-
-            if tech_name.contains(".monitor") || tech_name.contains("Monitor") {
-                let mut description = tech_name.clone();
-
-                if let Ok(desc_out) = Command::new("pactl").args(&["list", "sources"]).output() {
-                    let full = String::from_utf8_lossy(&desc_out.stdout);
-                    let mut found = false;
-                    for dl in full.lines() {
-                        if dl.contains(&format!("Name: {}", tech_name)) {
-                            found = true;
-                        } else if found && dl.trim().starts_with("Description:") {
-                            description = dl.replace("Description:", "").trim().to_string();
-                            break;
-                        }
-                    }
-                }
+/// Fuentes de PulseAudio/PipeWire como pares (nombre técnico, descripción).
+///
+/// Una sola llamada a `pactl list sources`: antes se lanzaba `pactl` una vez
+/// para el listado corto y otra más por cada fuente para buscar su
+/// descripción. Se fuerza `LC_ALL=C` porque las claves salen traducidas.
+pub fn list_pulse_sources() -> Vec<(String, String)> {
+    use std::process::Command;
 
-                devices.push(DeviceInfo {
-                    id: devices.len(),
-                    name: description,
-                    technical_name: Some(tech_name),
-                });
+    let output = match Command::new("pactl")
+        .args(&["list", "sources"])
+        .env("LC_ALL", "C")
+        .output()
+    {
+        Ok(out) => out,
+        Err(_) => return vec![],
+    };
+    parse_pulse_sources(&output.stdout)
+}
+
+/// Extrae los pares (nombre técnico, descripción) de la salida de
+/// `pactl list sources`.
+fn parse_pulse_sources(stdout: &[u8]) -> Vec<(String, String)> {
+    // La salida ocupa varios KB por fuente (propiedades, puertos, formatos)
+    // y solo interesan dos campos: se recorre en bytes y solo se decodifica
+    // como texto lo que se guarda.
+    let field = |value: &[u8]| String::from_utf8_lossy(value.trim_ascii()).into_owned();
+    let mut sources = vec![];
+    let mut current: Option<String> = None;
+
+    for line in stdout.split(|&b| b == b'\n') {
+        let line = line.trim_ascii_start();
+        if let Some(name) = line.strip_prefix(b"Name:") {
+            current = Some(field(name));
+        } else if let Some(desc) = line.strip_prefix(b"Description:") {
+            if let Some(name) = current.take() {
+                sources.push((name, field(desc)));
             }
         }
     }
 
-    devices
+    sources
+}
+
+/// Indica si hay un servidor PulseAudio/PipeWire que responda a `pactl`.
+/// Se comprueba una sola vez por proceso.
+pub fn pulse_available() -> bool {
+    static AVAILABLE: OnceLock<bool> = OnceLock::new();
+    *AVAILABLE.get_or_init(|| {
+        std::process::Command::new("pactl")
+            .arg("info")
+            .output()
+            .map(|o| o.status.success())
+            .unwrap_or(false)
+    })
+}
+
+// Sin PulseAudio/PipeWire (ALSA puro) no hay fuentes '.monitor': el
+// equivalente es el módulo snd-aloop, que cpal ve como un input más.
+
+fn check_alsa_loopback() -> LoopbackInfo {
+    let devices = get_alsa_loopback_devices();
+
+    if !devices.is_empty() {
+        LoopbackInfo {
+            status: LoopbackStatus::Available,
+            message: format!("✅ ALSA — {} dispositivos loopback detectados", devices.len()),
+            instructions: vec![
+                "Envía la salida del sistema al dispositivo 'Loopback' de ALSA.".into(),
+                "Úsalos en Configuración como fuentes de tipo SALIDA.".into(),
+            ],
+            loopback_devices: devices,
+        }
+    } else {
+        LoopbackInfo {
+            status: LoopbackStatus::RequiresSetup,
+            message: "⚠️ ALSA: no hay PulseAudio/PipeWire ni dispositivo loopback".to_string(),
+            instructions: vec![
+                "Carga el módulo de loopback de ALSA:".into(),
+                "  sudo modprobe snd-aloop".into(),
+                "".into(),
+                "O instala PipeWire/PulseAudio para usar los dispositivos '.monitor'.".into(),
+            ],
+            loopback_devices: vec![],
+        }
+    }
+}
+
+fn get_alsa_loopback_devices() -> Vec<DeviceInfo> {
+    enumerate_loopback_inputs(&["loopback", "aloop"])
 }
 
 // ── macOS ─────────────────────────────────────────────────────────────────
@@ -249,13 +354,32 @@ fn enumerate_loopback_inputs(keywords: &[&str]) -> Vec<DeviceInfo> {
     devices
 }
 
-// ── API pública ───────────────────────────────────────────────────────────
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn parses_name_and_description_pairs() {
+        let stdout = b"Source #0\n\
+            \tState: SUSPENDED\n\
+            \tName: alsa_output.pci.monitor\n\
+            \tDescription: Monitor of Built-in Audio \n\
+            \tProperties:\n\
+            \t\tdevice.description = \"Built-in Audio\"\n\
+            \n\
+            Source #1\n\
+            \tName: alsa_input.usb-mic\n\
+            \tDescription: USB Micr\xc3\xb3fono\n";
+        assert_eq!(parse_pulse_sources(stdout), [
+            ("alsa_output.pci.monitor".to_string(), "Monitor of Built-in Audio".to_string()),
+            ("alsa_input.usb-mic".to_string(), "USB Micrófono".to_string()),
+        ]);
+    }
 
-pub fn get_loopback_devices() -> Vec<DeviceInfo> {
-    match detect_os() {
-        "linux"   => get_linux_loopback_devices(),
-        "windows" => get_windows_loopback_devices(),
-        "macos"   => get_macos_loopback_devices(),
-        _         => vec![],
+    #[test]
+    fn skips_descriptions_without_a_name() {
+        let stdout = b"\tDescription: sin nombre\n\tName: a\n\tName: b\n\tDescription: B\n";
+        assert_eq!(parse_pulse_sources(stdout), [("b".to_string(), "B".to_string())]);
+        assert!(parse_pulse_sources(b"").is_empty());
     }
-}
\ No newline at end of file
+}
@@ -0,0 +1,27 @@
+use std::io::Read;
+
+// Utilidades compartidas por los tests unitarios.
+
+/// Lector que entrega `data` en trozos de los tamaños de `sizes` (en
+/// bucle), como una tubería que corta donde quiere.
+pub struct Trickle<'a> {
+    data: &'a [u8],
+    sizes: std::iter::Cycle<std::slice::Iter<'a, usize>>,
+}
+
+impl<'a> Trickle<'a> {
+    pub fn new(data: &'a [u8], sizes: &'a [usize]) -> Self {
+        Self { data, sizes: sizes.iter().cycle() }
+    }
+}
+
+impl Read for Trickle<'_> {
+    fn read(&mut self, buf: &mut [u8]) -> std::io::Result<usize> {
+        let n = self.sizes.next().copied().unwrap_or(usize::MAX)
+            .min(self.data.len())
+            .min(buf.len());
+        buf[..n].copy_from_slice(&self.data[..n]);
+        self.data = &self.data[n..];
+        Ok(n)
+    }
+}
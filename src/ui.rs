@@ -1,19 +1,25 @@
-use anyhow::{Result, anyhow};
+use anyhow::Result;
 use cpal::default_host;
 use eframe::egui;
-use std::sync::mpsc::{Receiver, channel};
+use std::borrow::Cow;
+use std::sync::mpsc::TryRecvError;
 use std::sync::atomic::{AtomicBool, Ordering};
 use std::sync::Arc;
+use std::io::{BufWriter, Write};
 use std::path::{Path, PathBuf};
 use std::thread;
 use chrono::Local;
 use crate::data::{
     AudioMessage, DeviceInfo, InterlocutorProfile, LanguageConfig,
-    SourceType, View, VideoMessage, SOURCE_LANGUAGES,
+    SourceType, View, VideoMessage, WakingReceiver, DEFAULT_WHISPER_MODEL, SOURCE_LANGUAGES,
+    DEST_LANGUAGES, WHISPER_MODELS, waking_channel,
+};
+use crate::audio::{
+    audio_thread_main, evict_idle_model, get_available_devices, is_model_loaded,
+    warm_up_whisper_model,
 };
-use crate::audio::{audio_thread_main, get_available_devices};
 use crate::video::video_transcription_thread;
-use crate::system_audio::{check_loopback_status, get_loopback_devices, LoopbackStatus, LoopbackInfo};
+use crate::system_audio::{check_loopback_status, LoopbackStatus, LoopbackInfo};
 
 pub struct TranscriptorApp {
     // ── Navegación ─────────────────────────────────────────────────────────
@@ -21,15 +27,24 @@ pub struct TranscriptorApp {
 
     // ── Transcripción en tiempo real ───────────────────────────────────────
     pub transcription: String,
-    pub status_message: String,
-    pub model_name: String,
+    pub status_message: Cow<'static, str>,
+    /// Entrada de `WHISPER_MODELS`: se copia a cada sesión sin reservar.
+    pub model_name: &'static str,
+    /// Modelo que se está precargando o que se precargó y ninguna sesión ha
+    /// usado todavía, con la señal que cancela la precarga.
+    pub preloaded_model: Option<(&'static str, Arc<AtomicBool>)>,
     pub is_running: bool,
     pub all_input_devices: Vec<DeviceInfo>,
     pub all_output_devices: Vec<DeviceInfo>,
     pub interlocutors: Vec<InterlocutorProfile>,
     pub output_dir: String,
-    pub ui_rx: Option<Receiver<AudioMessage>>,
+    pub ui_rx: Option<WakingReceiver<AudioMessage>>,
     pub stop_signal: Option<Arc<AtomicBool>>,
+    /// Hilo de la última captura. Tras pulsar "Detener" sigue vivo mientras
+    /// cierra los dispositivos: no se abre otra captura hasta que termine.
+    pub audio_thread: Option<thread::JoinHandle<()>>,
+    /// Guardado en curso de la minuta de la última captura.
+    pub minuta_save_thread: Option<thread::JoinHandle<Result<PathBuf>>>,
 
     // ── Configuración de idioma (global) ───────────────────────────────────
     pub lang_config: LanguageConfig,
@@ -41,43 +56,54 @@ pub struct TranscriptorApp {
     // ── Transcripción de vídeo ─────────────────────────────────────────────
     pub video_file_path: Option<String>,
     pub video_transcription: String,
-    pub video_status: String,
+    pub video_status: Cow<'static, str>,
     pub video_progress: f32,
     pub video_is_running: bool,
-    pub video_rx: Option<Receiver<VideoMessage>>,
+    pub video_rx: Option<WakingReceiver<VideoMessage>>,
     pub video_stop_signal: Option<Arc<AtomicBool>>,
+    /// Hilo de la transcripción en curso. Ocupa el sitio desde que se lanza
+    /// hasta que se cierra su canal: nunca hay dos transcripciones a la vez.
+    pub video_thread: Option<thread::JoinHandle<()>>,
+    /// Guardado en curso de la transcripción de vídeo. Se escribe fuera del
+    /// hilo de la UI: con vídeos largos el texto ocupa megabytes.
+    pub video_save_thread: Option<thread::JoinHandle<Result<PathBuf>>>,
 }
 
 impl Default for TranscriptorApp {
     fn default() -> Self {
-        let host = default_host();
-        let all_input_devices = get_available_devices(&host, true);
-        let all_output_devices = get_loopback_devices();
-
         let mut app = Self {
             current_view: View::Transcription,
             transcription: String::from("El texto transcrito aparecerá aquí.\n"),
-            status_message: String::from("Presiona 'Iniciar Captura' para comenzar."),
-            model_name: String::from("large-v3"),
+            status_message: "Presiona 'Iniciar Captura' para comenzar.".into(),
+            model_name: DEFAULT_WHISPER_MODEL,
+            preloaded_model: None,
             is_running: false,
-            all_input_devices,
-            all_output_devices,
+            all_input_devices: Vec::new(),
+            all_output_devices: Vec::new(),
             interlocutors: Vec::new(),
             output_dir: String::from("./minutas"),
             ui_rx: None,
             stop_signal: None,
+            audio_thread: None,
+            minuta_save_thread: None,
             lang_config: LanguageConfig::default(),
             loopback_info: None,
             show_loopback_setup: false,
             video_file_path: None,
             video_transcription: String::new(),
-            video_status: String::from("Selecciona un archivo de vídeo o audio."),
+            video_status: "Selecciona un archivo de vídeo o audio.".into(),
             video_progress: 0.0,
             video_is_running: false,
             video_rx: None,
             video_stop_signal: None,
+            video_thread: None,
+            video_save_thread: None,
         };
 
+        app.warm_up_selected_model();
+
+        app.refresh_devices();
+
         if !app.all_input_devices.is_empty() {
             app.add_new_profile(SourceType::Input);
         }
@@ -92,44 +118,92 @@ impl Default for TranscriptorApp {
 impl eframe::App for TranscriptorApp {
     fn update(&mut self, ctx: &egui::Context, _frame: &mut eframe::Frame) {
         // ── Procesar mensajes de audio en tiempo real ──────────────────────
+        let mut audio_finished = false;
         if let Some(rx) = &self.ui_rx {
-            while let Ok(msg) = rx.try_recv() {
+            loop {
+                let msg = match rx.try_recv() {
+                    Ok(msg) => msg,
+                    Err(TryRecvError::Empty) => break,
+                    Err(TryRecvError::Disconnected) => { audio_finished = true; break; }
+                };
                 match msg {
                     AudioMessage::Status(s) => self.status_message = s,
                     AudioMessage::Transcription { text, name } => {
-                        if !text.trim().is_empty() {
-                            self.transcription.push_str(&format!("({}) {}\n", name, text));
-                        }
+                        // El texto llega ya recortado y no vacío: se añade
+                        // directamente, sin formatear una cadena intermedia.
+                        self.transcription.push('(');
+                        self.transcription.push_str(&name);
+                        self.transcription.push_str(") ");
+                        self.transcription.push_str(&text);
+                        self.transcription.push('\n');
                     }
-                    AudioMessage::Error(e) => self.status_message = format!("❌ Error: {}", e),
+                    AudioMessage::Error(e) => self.status_message = format!("❌ Error: {}", e).into(),
                 }
             }
         }
+        if audio_finished {
+            // El canal se cierra cuando el hilo suelta su emisor, justo antes
+            // de terminar: el join es inmediato y libera el hilo y la señal
+            // de parada en vez de retenerlos hasta la próxima captura.
+            // También cuando todos los streams fallan sin pulsar "Detener":
+            // la UI deja de mostrar la captura como activa.
+            self.ui_rx = None;
+            self.stop_signal = None;
+            self.is_running = false;
+            if let Some(handle) = self.audio_thread.take() {
+                let _ = handle.join();
+            }
+        }
 
         // ── Procesar mensajes de vídeo ─────────────────────────────────────
+        let mut video_finished = false;
+        let mut video_done = false;
         if let Some(rx) = &self.video_rx {
-            while let Ok(msg) = rx.try_recv() {
+            loop {
+                let msg = match rx.try_recv() {
+                    Ok(msg) => msg,
+                    Err(TryRecvError::Empty) => break,
+                    Err(TryRecvError::Disconnected) => { video_finished = true; break; }
+                };
                 match msg {
                     VideoMessage::Status(s) => self.video_status = s,
                     VideoMessage::Progress(p) => self.video_progress = p,
-                    VideoMessage::Segment { timestamp, text } => {
-                        self.video_transcription
-                            .push_str(&format!("[{}] {}\n", timestamp, text));
-                    }
+                    VideoMessage::Segments(lines) => self.video_transcription.push_str(&lines),
                     VideoMessage::Done => {
                         self.video_is_running = false;
-                        self.video_status = "✅ Transcripción completada.".into();
-                        if let Err(e) = self.save_video_transcript() {
-                            self.video_status = format!("❌ Error al guardar: {:?}", e);
-                        }
+                        self.video_status = "✅ Transcripción completada. Guardando...".into();
+                        video_done = true;
                     }
                     VideoMessage::Error(e) => {
                         self.video_is_running = false;
-                        self.video_status = format!("❌ Error: {}", e);
+                        self.video_status = format!("❌ Error: {}", e).into();
                     }
                 }
             }
         }
+        if video_done {
+            self.save_video_transcript(ctx);
+        }
+        if video_finished {
+            // Tras cancelar no llega `Done` ni `Error`: el cierre del canal
+            // es lo que marca el fin de la transcripción.
+            self.video_rx = None;
+            self.video_stop_signal = None;
+            self.video_is_running = false;
+            if let Some(handle) = self.video_thread.take() {
+                let _ = handle.join();
+            }
+        }
+        if let Some(result) = take_finished(&mut self.video_save_thread) {
+            self.video_status = save_status("Guardado en", result).into();
+        }
+        // El resultado de la minuta se muestra cuando la captura ya ha
+        // terminado, para que no lo pise su último mensaje de estado.
+        if self.audio_thread.is_none() {
+            if let Some(result) = take_finished(&mut self.minuta_save_thread) {
+                self.status_message = save_status("Minuta guardada en", result).into();
+            }
+        }
 
         // ── UI ─────────────────────────────────────────────────────────────
         egui::TopBottomPanel::top("top_panel").show(ctx, |ui| {
@@ -156,26 +230,95 @@ impl eframe::App for TranscriptorApp {
         if self.show_loopback_setup {
             self.show_loopback_dialog(ctx);
         }
+    }
 
-        ctx.request_repaint();
+    // Al cerrar la ventana se avisa a la vez a todos los hilos de trabajo y
+    // después se espera a cada uno: el cierre tarda lo que el más lento, no
+    // la suma, y los hilos que aún guardan (minuta, vídeo) terminan de
+    // escribir en vez de morir con el proceso a medio fichero.
+    fn on_exit(&mut self, _gl: Option<&eframe::glow::Context>) {
+        // Una captura en marcha se guarda como al pulsar "Detener"
+        if self.is_running {
+            self.stop_audio_capture(None);
+        }
+        if let Some(sig) = self.video_stop_signal.take() {
+            sig.store(true, Ordering::SeqCst);
+        }
+        // Con la señal de parada los hilos acaban enseguida: la decodificación
+        // se aborta y la descarga y la espera de un modelo la comprueban.
+        for handle in [self.audio_thread.take(), self.video_thread.take()].into_iter().flatten() {
+            let _ = handle.join();
+        }
+        for handle in [self.minuta_save_thread.take(), self.video_save_thread.take()].into_iter().flatten() {
+            let _ = handle.join();
+        }
     }
 }
 
 impl TranscriptorApp {
     // ── Pestaña: Transcripción en tiempo real ──────────────────────────────
 
+    /// Prefijo del fichero de la minuta: los interlocutores activos.
+    fn minuta_file_tag(&self) -> String {
+        self.interlocutors.iter()
+            .filter(|p| p.is_active)
+            .map(|p| p.name.replace(' ', "_"))
+            .collect::<Vec<_>>()
+            .join("_")
+    }
+
+    /// Precarga en segundo plano el modelo elegido: al pulsar "Iniciar" ya
+    /// está en memoria. El que se precargó antes y ninguna sesión ha usado
+    /// se saca de la caché; con dos huecos se quedaría ocupando memoria
+    /// junto al elegido.
+    fn warm_up_selected_model(&mut self) {
+        if let Some((model, cancel)) = self.preloaded_model.take() {
+            cancel.store(true, Ordering::SeqCst);
+            evict_idle_model(model);
+        }
+        let model = self.model_name;
+        if is_model_loaded(model) {
+            return;
+        }
+        let cancel = Arc::new(AtomicBool::new(false));
+        self.preloaded_model = Some((model, cancel.clone()));
+        thread::spawn(move || warm_up_whisper_model(model, &cancel));
+    }
+
     fn check_and_prompt_loopback(&mut self) {
-        if let Ok(info) = check_loopback_status() {
+        if let Some(info) = &self.loopback_info {
             if info.status == LoopbackStatus::NeedsConfiguration
                 || info.status == LoopbackStatus::RequiresSetup
             {
-                self.loopback_info = Some(info);
                 self.show_loopback_setup = true;
             }
         }
     }
 
-    fn start_audio_capture(&mut self) {
+    /// Vuelve a enumerar micrófonos y dispositivos loopback. Es lento (pactl,
+    /// COM, ALSA según la plataforma), así que solo se hace al arrancar y al
+    /// pulsar "Actualizar Dispositivos"; el resto de la UI usa lo guardado.
+    fn refresh_devices(&mut self) {
+        // Las dos enumeraciones son independientes (y la mayor parte del
+        // tiempo esperan a pactl o al driver): se hacen a la vez.
+        let (inputs, loopback) = thread::scope(|s| {
+            let inputs = s.spawn(|| get_available_devices(&default_host(), true));
+            let loopback = check_loopback_status().ok();
+            (inputs.join().unwrap_or_default(), loopback)
+        });
+        self.all_input_devices = inputs;
+        self.loopback_info = loopback;
+        self.all_output_devices = self.loopback_info.as_ref()
+            .map(|info| info.loopback_devices.clone())
+            .unwrap_or_default();
+    }
+
+    fn start_audio_capture(&mut self, ctx: &egui::Context) {
+        if self.audio_thread.as_ref().map_or(false, |h| !h.is_finished()) {
+            self.status_message = "⏳ La captura anterior aún se está cerrando.".into();
+            return;
+        }
+
         let active: Vec<InterlocutorProfile> = self.interlocutors
             .iter().filter(|p| p.is_active).cloned().collect();
 
@@ -184,25 +327,53 @@ impl TranscriptorApp {
             return;
         }
 
-        let (tx, rx) = channel::<AudioMessage>();
+        let (tx, rx) = waking_channel::<AudioMessage>(ctx);
         self.ui_rx = Some(rx);
 
         let stop = Arc::new(AtomicBool::new(false));
         self.stop_signal = Some(stop.clone());
 
-        let model = self.model_name.clone();
+        // La sesión se queda con el modelo precargado: pasa a ser uno usado
+        // más de la caché y ya no se descarta al elegir otro.
+        self.preloaded_model = None;
+        let model = self.model_name;
         let n = active.len();
-        let lang = self.lang_config.clone();
+        let lang = self.lang_config;
 
-        thread::spawn(move || {
+        self.audio_thread = Some(thread::spawn(move || {
             if let Err(e) = audio_thread_main(model, tx.clone(), stop, active, lang) {
                 let _ = tx.send(AudioMessage::Error(format!("{:?}", e)));
             }
-        });
+        }));
 
         self.is_running = true;
         self.transcription.clear();
-        self.status_message = format!("Iniciando {} fuentes de audio...", n);
+        self.status_message = format!("Iniciando {} fuentes de audio...", n).into();
+    }
+
+    /// Detiene la captura en curso y guarda su minuta en segundo plano.
+    /// `ctx` se repinta al terminar el guardado para mostrar el resultado;
+    /// al cerrar la app no se pasa, ya no hay nada que repintar.
+    fn stop_audio_capture(&mut self, ctx: Option<egui::Context>) {
+        if let Some(sig) = self.stop_signal.take() {
+            sig.store(true, Ordering::SeqCst);
+        }
+        self.is_running = false;
+        // Guardar en hilo separado para no bloquear el render loop
+        // justo cuando el driver está liberando recursos de GPU.
+        let content = self.transcription.clone();
+        let output_dir = self.output_dir.clone();
+        let names = self.minuta_file_tag();
+        // Se conserva el hilo para mostrar el resultado: stderr
+        // está silenciado en Linux y un error ahí se perdería.
+        self.minuta_save_thread = Some(thread::spawn(move || {
+            let result = write_markdown(&output_dir, &names, MINUTA_TITLE, &content);
+            if let Some(ctx) = ctx {
+                ctx.request_repaint();
+            }
+            result
+        }));
+        self.status_message = "Captura detenida. Guardando minuta...".into();
     }
 
     fn transcriber_ui(&mut self, ui: &mut egui::Ui) {
@@ -212,11 +383,14 @@ impl TranscriptorApp {
         ui.horizontal(|ui| {
             ui.label("Modelo Whisper:");
             egui::ComboBox::from_label("")
-                .selected_text(&self.model_name)
+                .selected_text(self.model_name)
                 .width(150.0)
                 .show_ui(ui, |ui| {
-                    ui.selectable_value(&mut self.model_name, "medium".into(), "Medium");
-                    ui.selectable_value(&mut self.model_name, "large-v3".into(), "Large-v3");
+                    for (label, name) in WHISPER_MODELS {
+                        if ui.selectable_value(&mut self.model_name, *name, *label).changed() {
+                            self.warm_up_selected_model();
+                        }
+                    }
                 });
         });
 
@@ -227,34 +401,9 @@ impl TranscriptorApp {
 
         if ui.add_enabled(enabled, egui::Button::new(btn)).clicked() {
             if self.is_running {
-                if let Some(sig) = self.stop_signal.take() {
-                    sig.store(true, Ordering::SeqCst);
-                }
-                self.is_running = false;
-                // Guardar en hilo separado para no bloquear el render loop
-                // justo cuando el driver está liberando recursos de GPU.
-                let content = self.transcription.clone();
-                let output_dir = self.output_dir.clone();
-                let names: String = self.interlocutors.iter()
-                    .filter(|p| p.is_active)
-                    .map(|p| p.name.replace(' ', "_"))
-                    .collect::<Vec<_>>()
-                    .join("_");
-                thread::spawn(move || {
-                    let timestamp = Local::now().format("%Y%m%d_%H%M%S").to_string();
-                    let path = Path::new(&output_dir).join(format!("{}_{}.md", names, timestamp));
-                    if let Err(e) = std::fs::create_dir_all(&output_dir)
-                        .and_then(|_| std::fs::write(&path, format!(
-                            "# Minuta de Transcripción\n\nFecha: {}\n\n---\n\n{}",
-                            Local::now().format("%d-%m-%Y %H:%M:%S"), content
-                        )))
-                    {
-                        eprintln!("Error al guardar minuta: {:?}", e);
-                    }
-                });
-                self.status_message = "Captura detenida. Guardando minuta...".into();
+                self.stop_audio_capture(Some(ui.ctx().clone()));
             } else if self.interlocutors.iter().any(|p| p.is_active) {
-                self.start_audio_capture();
+                self.start_audio_capture(ui.ctx());
             } else {
                 self.status_message = "❌ Active al menos un interlocutor en Configuración.".into();
             }
@@ -266,7 +415,7 @@ impl TranscriptorApp {
             ui.label("Estado:");
             ui.colored_label(
                 if self.is_running { egui::Color32::GREEN } else { egui::Color32::GRAY },
-                &self.status_message,
+                self.status_message.as_ref(),
             );
         });
 
@@ -335,11 +484,14 @@ impl TranscriptorApp {
             ui.label("Modelo:");
             ui.add_enabled_ui(!self.video_is_running, |ui| {
                 egui::ComboBox::from_id_salt("video_model")
-                    .selected_text(&self.model_name)
+                    .selected_text(self.model_name)
                     .width(150.0)
                     .show_ui(ui, |ui| {
-                        ui.selectable_value(&mut self.model_name, "medium".into(), "Medium");
-                        ui.selectable_value(&mut self.model_name, "large-v3".into(), "Large-v3");
+                        for (label, name) in WHISPER_MODELS {
+                            if ui.selectable_value(&mut self.model_name, *name, *label).changed() {
+                                self.warm_up_selected_model();
+                            }
+                        }
                     });
             });
 
@@ -354,7 +506,7 @@ impl TranscriptorApp {
                     }
                 }
             } else if ui.add_enabled(can_start, egui::Button::new("▶ Transcribir")).clicked() {
-                self.start_video_transcription();
+                self.start_video_transcription(ui.ctx());
             }
         });
 
@@ -373,7 +525,7 @@ impl TranscriptorApp {
             ui.label("Estado:");
             ui.colored_label(
                 if self.video_is_running { egui::Color32::GREEN } else { egui::Color32::GRAY },
-                &self.video_status,
+                self.video_status.as_ref(),
             );
         });
 
@@ -400,36 +552,37 @@ impl TranscriptorApp {
                 self.video_progress = 0.0;
             }
             if !self.video_transcription.is_empty() && !self.video_is_running {
-                if ui.button("💾 Guardar").clicked() {
-                    match self.save_video_transcript() {
-                        Ok(p) => self.video_status = format!("✅ Guardado en: {}", p.display()),
-                        Err(e) => self.video_status = format!("❌ Error al guardar: {:?}", e),
-                    }
+                if ui.add_enabled(self.video_save_thread.is_none(), egui::Button::new("💾 Guardar")).clicked() {
+                    self.save_video_transcript(ui.ctx());
                 }
             }
         });
     }
 
-    fn start_video_transcription(&mut self) {
+    fn start_video_transcription(&mut self, ctx: &egui::Context) {
+        if self.video_thread.is_some() {
+            return;
+        }
         let file_path = match &self.video_file_path {
             Some(p) => p.clone(),
             None => return,
         };
 
-        let (tx, rx) = channel::<VideoMessage>();
+        let (tx, rx) = waking_channel::<VideoMessage>(ctx);
         self.video_rx = Some(rx);
 
         let stop = Arc::new(AtomicBool::new(false));
         self.video_stop_signal = Some(stop.clone());
 
-        let model = self.model_name.clone();
-        let lang = self.lang_config.clone();
+        self.preloaded_model = None;
+        let model = self.model_name;
+        let lang = self.lang_config;
 
-        thread::spawn(move || {
+        self.video_thread = Some(thread::spawn(move || {
             if let Err(e) = video_transcription_thread(file_path, model, lang, tx.clone(), stop) {
                 let _ = tx.send(VideoMessage::Error(format!("{:?}", e)));
             }
-        });
+        }));
 
         self.video_is_running = true;
         self.video_transcription.clear();
@@ -437,9 +590,11 @@ impl TranscriptorApp {
         self.video_status = "Iniciando...".into();
     }
 
-    fn save_video_transcript(&self) -> Result<PathBuf> {
+    /// Lanza el guardado en segundo plano; `update` recoge el resultado.
+    fn save_video_transcript(&mut self, ctx: &egui::Context) {
         if self.video_transcription.trim().is_empty() {
-            return Err(anyhow!("No hay transcripción para guardar."));
+            self.video_status = "❌ Error al guardar: No hay transcripción para guardar.".into();
+            return;
         }
 
         let stem = self.video_file_path
@@ -447,22 +602,15 @@ impl TranscriptorApp {
             .and_then(|p| Path::new(p).file_stem())
             .map(|s| s.to_string_lossy().replace(' ', "_"))
             .unwrap_or_else(|| "video".into());
-
-        let timestamp = Local::now().format("%Y%m%d_%H%M%S").to_string();
-        let filename = format!("{}_{}.md", stem, timestamp);
-        let output_path = Path::new(&self.output_dir).join(filename);
-
-        std::fs::create_dir_all(&self.output_dir)?;
-
-        let content = format!(
-            "# Transcripción: {}\n\nFecha: {}\n\n---\n\n{}",
-            stem,
-            Local::now().format("%d-%m-%Y %H:%M:%S"),
-            self.video_transcription
-        );
-
-        std::fs::write(&output_path, content)?;
-        Ok(output_path)
+        let output_dir = self.output_dir.clone();
+        let body = self.video_transcription.clone();
+        let ctx = ctx.clone();
+
+        self.video_save_thread = Some(thread::spawn(move || {
+            let result = write_markdown(&output_dir, &stem, &format!("Transcripción: {}", stem), &body);
+            ctx.request_repaint();
+            result
+        }));
     }
 
     // ── Pestaña: Configuración ─────────────────────────────────────────────
@@ -494,16 +642,9 @@ impl TranscriptorApp {
                     .selected_text(self.lang_config.dest_label())
                     .width(200.0)
                     .show_ui(ui, |ui| {
-                        ui.selectable_value(
-                            &mut self.lang_config.translate_to_english,
-                            false,
-                            "Original (sin traducción)",
-                        );
-                        ui.selectable_value(
-                            &mut self.lang_config.translate_to_english,
-                            true,
-                            "English (traducir)",
-                        );
+                        for (label, translate) in DEST_LANGUAGES {
+                            ui.selectable_value(&mut self.lang_config.translate_to_english, *translate, *label);
+                        }
                     });
             });
 
@@ -522,7 +663,6 @@ impl TranscriptorApp {
         // Loopback
         ui.horizontal(|ui| {
             if ui.button("📊 Configurar Captura de Salida").clicked() {
-                self.loopback_info = check_loopback_status().ok();
                 self.show_loopback_setup = true;
             }
             let n = self.all_output_devices.len();
@@ -545,7 +685,6 @@ impl TranscriptorApp {
                 if ui.button("➕ Salida (Loopback)").clicked() {
                     if self.all_output_devices.is_empty() {
                         self.status_message = "⚠️ Configure dispositivos loopback primero".into();
-                        self.loopback_info = check_loopback_status().ok();
                         self.show_loopback_setup = true;
                     } else {
                         self.add_new_profile(SourceType::Output);
@@ -575,7 +714,7 @@ impl TranscriptorApp {
                     let device_name = Self::get_device_name_static(
                         input_devices,
                         output_devices,
-                        profile.source_type.clone(),
+                        profile.source_type,
                         profile.device_id,
                     );
 
@@ -665,12 +804,10 @@ impl TranscriptorApp {
                     ui.separator();
                     ui.horizontal(|ui| {
                         if ui.button("🔄 Actualizar Dispositivos").clicked() {
-                            let host = default_host();
-                            self.all_input_devices = get_available_devices(&host, true);
-                            self.all_output_devices = get_loopback_devices();
+                            self.refresh_devices();
                             let n = self.all_output_devices.len();
                             self.status_message = if n > 0 {
-                                format!("✅ {} dispositivos loopback detectados", n)
+                                format!("✅ {} dispositivos loopback detectados", n).into()
                             } else {
                                 "⚠️ No se detectaron dispositivos loopback".into()
                             };
@@ -713,40 +850,56 @@ impl TranscriptorApp {
         }
     }
 
-    fn save_transcript(&self) -> Result<PathBuf> {
-        if self.transcription.trim().is_empty() {
-            return Err(anyhow!("No hay transcripción para guardar."));
-        }
-        let timestamp = Local::now().format("%Y%m%d_%H%M%S").to_string();
-        let names: String = self.interlocutors.iter()
-            .filter(|p| p.is_active)
-            .map(|p| p.name.replace(' ', "_"))
-            .collect::<Vec<_>>()
-            .join("_");
-        let output_path = Path::new(&self.output_dir).join(format!("{}_{}.md", names, timestamp));
-        std::fs::create_dir_all(&self.output_dir)?;
-        std::fs::write(
-            &output_path,
-            format!(
-                "# Minuta de Transcripción\n\nFecha: {}\n\n---\n\n{}",
-                Local::now().format("%d-%m-%Y %H:%M:%S"),
-                self.transcription
-            ),
-        )?;
-        Ok(output_path)
-    }
-
-    fn get_device_name_static(
-        inputs: &[DeviceInfo], outputs: &[DeviceInfo],
+    /// Se llama por perfil en cada frame: devuelve el nombre prestado de la
+    /// lista de dispositivos en vez de copiarlo.
+    fn get_device_name_static<'a>(
+        inputs: &'a [DeviceInfo], outputs: &'a [DeviceInfo],
         source_type: SourceType, device_id: usize,
-    ) -> String {
+    ) -> &'a str {
         let devices = match source_type {
             SourceType::Input => inputs,
             SourceType::Output => outputs,
         };
         devices.iter()
             .find(|d| d.id == device_id)
-            .map(|d| d.name.clone())
-            .unwrap_or_else(|| "Dispositivo no encontrado".into())
+            .map_or("Dispositivo no encontrado", |d| d.name.as_str())
     }
-}
\ No newline at end of file
+}
+
+/// Recoge el resultado de un hilo auxiliar si ya ha terminado, dejando el
+/// hueco libre. Si sigue en marcha no bloquea.
+fn take_finished<T>(slot: &mut Option<thread::JoinHandle<T>>) -> Option<thread::Result<T>> {
+    if slot.as_ref().map_or(false, |h| h.is_finished()) {
+        slot.take().map(|h| h.join())
+    } else {
+        None
+    }
+}
+
+/// Mensaje de estado para el resultado de un guardado en segundo plano.
+fn save_status(done_label: &str, result: thread::Result<Result<PathBuf>>) -> String {
+    match result {
+        Ok(Ok(p)) => format!("✅ {}: {}", done_label, p.display()),
+        Ok(Err(e)) => format!("❌ Error al guardar: {:?}", e),
+        Err(_) => "❌ Error al guardar.".into(),
+    }
+}
+
+const MINUTA_TITLE: &str = "Minuta de Transcripción";
+
+/// Escribe `<dir>/<prefijo>_<fecha>.md` con cabecera, fecha y el texto.
+/// Compartido por la minuta en tiempo real y la transcripción de vídeo.
+fn write_markdown(output_dir: &str, prefix: &str, title: &str, body: &str) -> Result<PathBuf> {
+    let now = Local::now();
+    let output_path = Path::new(output_dir)
+        .join(format!("{}_{}.md", prefix, now.format("%Y%m%d_%H%M%S")));
+
+    std::fs::create_dir_all(output_dir)?;
+    // La cabecera y el texto se escriben por separado: no se copia la
+    // transcripción entera a una cadena nueva solo para guardarla.
+    let mut file = BufWriter::new(std::fs::File::create(&output_path)?);
+    write!(file, "# {}\n\nFecha: {}\n\n---\n\n", title, now.format("%d-%m-%Y %H:%M:%S"))?;
+    file.write_all(body.as_bytes())?;
+    file.flush()?;
+    Ok(output_path)
+}
@@ -2,32 +2,37 @@ use anyhow::{Result, anyhow};
 use std::io::Read;
 use std::process::{Command, Stdio};
 use std::sync::atomic::{AtomicBool, Ordering};
+use std::sync::mpsc::{channel, sync_channel, Receiver, Sender, SyncSender};
 use std::sync::Arc;
-use tokio::runtime::Runtime;
-use whisper_rs::{FullParams, SamplingStrategy, WhisperContext};
+use std::thread;
 
-use crate::audio::download_whisper_model;
-use crate::data::{LanguageConfig, VideoMessage, WHISPER_SAMPLE_RATE};
+use crate::audio::{load_whisper_context, transcription_params, abort_on_stop, has_voice_activity, whisper_threads_per_stream, ChildGuard};
+use crate::data::{LanguageConfig, VideoMessage, VideoSender, WHISPER_SAMPLE_RATE};
 
 /// Chunks de 30 segundos — ventana nativa de Whisper, calidad óptima.
 const VIDEO_CHUNK_SECS: u32 = 30;
 
+/// Tamaño de cada lectura de la salida de ffmpeg (1 MiB).
+const FFMPEG_READ_BLOCK: usize = 1 << 20;
+
+/// Fragmentos ya decodificados que el lector puede adelantar a Whisper.
+const PREFETCH_CHUNKS: usize = 2;
+
 pub fn video_transcription_thread(
     file_path: String,
-    model_name: String,
+    model_name: &'static str,
     lang_config: LanguageConfig,
-    tx: std::sync::mpsc::Sender<VideoMessage>,
+    tx: VideoSender,
     stop_signal: Arc<AtomicBool>,
 ) -> Result<()> {
-    // ── 1. Descargar / localizar modelo ────────────────────────────────────
-    let _ = tx.send(VideoMessage::Status("Verificando modelo...".into()));
-    let model_path = Runtime::new()?
-        .block_on(download_whisper_model(&model_name))?;
-
-    // ── 2. Extraer audio con ffmpeg ────────────────────────────────────────
+    // ── 1. Extraer audio con ffmpeg ────────────────────────────────────────
     let _ = tx.send(VideoMessage::Status("Extrayendo audio con ffmpeg...".into()));
 
-    let mut child = Command::new("ffmpeg")
+    let total_secs = probe_duration_secs(&file_path);
+
+    // El guard mata y espera a ffmpeg en cualquier salida: cancelación,
+    // error al cargar el modelo o fin normal.
+    let mut child = ChildGuard(Command::new("ffmpeg")
         .args(&[
             "-i", &file_path,
             "-ar", &WHISPER_SAMPLE_RATE.to_string(),
@@ -39,94 +44,130 @@ pub fn video_transcription_thread(
         .stdout(Stdio::piped())
         .stderr(Stdio::null()) // silenciar output de ffmpeg
         .spawn()
-        .map_err(|e| anyhow!("Error iniciando ffmpeg: {:?}\n¿Está ffmpeg instalado?", e))?;
+        .map_err(|e| anyhow!("Error iniciando ffmpeg: {:?}\n¿Está ffmpeg instalado?", e))?);
 
-    let mut stdout = child.stdout.take()
+    let stdout = child.stdout.take()
         .ok_or_else(|| anyhow!("No se pudo obtener stdout de ffmpeg"))?;
 
-    let mut audio_bytes = Vec::new();
-    stdout.read_to_end(&mut audio_bytes)?;
-    let _ = child.wait();
-
-    if audio_bytes.is_empty() {
-        return Err(anyhow!("ffmpeg no produjo audio. ¿Es un archivo de vídeo/audio válido?"));
-    }
-
-    // Convertir bytes a muestras f32
-    let audio: Vec<f32> = audio_bytes
-        .chunks_exact(4)
-        .map(|b| f32::from_le_bytes([b[0], b[1], b[2], b[3]]))
-        .collect();
+    // La extracción corre en paralelo con la carga del modelo y con la
+    // transcripción: el lector va dejando fragmentos en un canal acotado
+    // mientras Whisper procesa el anterior.
+    let chunk_samples = (WHISPER_SAMPLE_RATE * VIDEO_CHUNK_SECS) as usize;
+    // Los fragmentos ya transcritos vuelven al lector para reutilizarse: en
+    // régimen estable circulan PREFETCH_CHUNKS + 2 buffers sin reservar más.
+    let (chunk_tx, chunk_rx) = sync_channel::<Vec<f32>>(PREFETCH_CHUNKS);
+    let (recycle_tx, recycle_rx) = channel::<Vec<f32>>();
+    let reader = thread::spawn(move || read_audio_chunks(stdout, chunk_tx, recycle_rx, chunk_samples));
 
-    let total_samples = audio.len();
-    let total_secs = total_samples as f64 / WHISPER_SAMPLE_RATE as f64;
+    let total_chunks = total_secs
+        .map(|secs| ((secs / VIDEO_CHUNK_SECS as f64).ceil() as usize).max(1));
 
-    let _ = tx.send(VideoMessage::Status(format!(
-        "Audio extraído: {} ({} muestras). Cargando modelo...",
-        format_timestamp(total_secs),
-        total_samples,
-    )));
+    let _ = tx.send(VideoMessage::Status(match total_secs {
+        Some(secs) => format!("Duración: {}. Cargando modelo...", format_timestamp(secs)).into(),
+        None => "Cargando modelo...".into(),
+    }));
 
-    // ── 3. Cargar modelo Whisper ───────────────────────────────────────────
-    let ctx = WhisperContext::new_with_params(&model_path, Default::default())
-        .map_err(|e| anyhow!("Error cargando modelo: {:?}", e))?;
+    // ── 2. Cargar modelo Whisper (descargándolo si falta) ──────────────────
+    let ctx = load_whisper_context(model_name, &stop_signal)?;
     let mut state = ctx.create_state()
         .map_err(|e| anyhow!("Error creando estado: {:?}", e))?;
 
-    // ── 4. Transcribir chunk a chunk ───────────────────────────────────────
-    let chunk_samples = (WHISPER_SAMPLE_RATE * VIDEO_CHUNK_SECS) as usize;
-    let starts: Vec<usize> = (0..total_samples).step_by(chunk_samples).collect();
-    let total_chunks = starts.len();
+    // ── 3. Transcribir chunk a chunk ───────────────────────────────────────
+    // Este hilo es el único que llama a Whisper: se queda con todos los
+    // núcleos en vez de los 4 hilos que usa por defecto.
+    let mut params = transcription_params(&lang_config);
+    params.set_n_threads(whisper_threads_per_stream(1));
+    // Cada línea lleva la marca de tiempo del fragmento, no la de sus
+    // segmentos: Whisper no necesita predecir tokens de tiempo. Sin ellos
+    // devuelve el fragmento en un solo segmento, que se parte en frases.
+    params.set_no_timestamps(true);
+    abort_on_stop(&mut params, &stop_signal);
+    let mut chunk_idx = 0;
 
-    for (chunk_idx, &chunk_start) in starts.iter().enumerate() {
+    for chunk in chunk_rx.iter() {
         if stop_signal.load(Ordering::SeqCst) {
             let _ = tx.send(VideoMessage::Status("Transcripción cancelada.".into()));
             return Ok(());
         }
 
-        let chunk_end = (chunk_start + chunk_samples).min(total_samples);
-        let chunk = &audio[chunk_start..chunk_end];
-        let time_offset_secs = chunk_start as f64 / WHISPER_SAMPLE_RATE as f64;
-
-        let progress = (chunk_idx + 1) as f32 / total_chunks as f32;
-        let _ = tx.send(VideoMessage::Progress(progress));
-        let _ = tx.send(VideoMessage::Status(format!(
-            "Fragmento {}/{} [{}]",
-            chunk_idx + 1,
-            total_chunks,
-            format_timestamp(time_offset_secs),
-        )));
-
-        let mut params = FullParams::new(SamplingStrategy::Greedy { best_of: 1 });
-        params.set_language(lang_config.source_lang);
-        params.set_translate(lang_config.translate_to_english);
-        params.set_print_special(false);
-        params.set_print_progress(false);
-        params.set_print_realtime(false);
-        params.set_print_timestamps(false);
-        params.set_suppress_blank(true);
-        params.set_suppress_nst(true);
-        params.set_no_speech_thold(0.6);
-
-        match state.full(params, chunk) {
+        let time_offset_secs = (chunk_idx * chunk_samples) as f64 / WHISPER_SAMPLE_RATE as f64;
+
+        match total_chunks {
+            Some(total) => {
+                let progress = ((chunk_idx + 1) as f32 / total as f32).min(1.0);
+                let _ = tx.send(VideoMessage::Progress(progress));
+                let _ = tx.send(VideoMessage::Status(format!(
+                    "Fragmento {}/{} [{}]",
+                    chunk_idx + 1,
+                    total,
+                    format_timestamp(time_offset_secs),
+                ).into()));
+            }
+            None => {
+                let _ = tx.send(VideoMessage::Status(format!(
+                    "Fragmento {} [{}]",
+                    chunk_idx + 1,
+                    format_timestamp(time_offset_secs),
+                ).into()));
+            }
+        }
+
+        // Un fragmento en silencio (intros, pausas largas) no produce texto:
+        // se salta sin pasar por el codificador de Whisper.
+        if !has_voice_activity(&chunk) {
+            recycle(&recycle_tx, chunk);
+            chunk_idx += 1;
+            continue;
+        }
+
+        match state.full(params.clone(), &chunk) {
             Ok(_) => {
+                // Todas las líneas del fragmento van en un solo mensaje: un
+                // envío y un repintado por fragmento en vez de uno por segmento.
+                let timestamp = format_timestamp(time_offset_secs);
+                let mut lines = String::new();
                 let n = state.full_n_segments();
                 for i in 0..n {
                     if let Some(segment) = state.get_segment(i) {
-                        let text = segment.to_string().trim().to_string();
-                        if text.is_empty() || text.len() <= 1 {
-                            continue;
+                        // El texto se lee prestado del estado de Whisper; solo
+                        // se copia si no es UTF-8 válido.
+                        let Ok(text) = segment.to_str_lossy() else { continue };
+                        for sentence in sentences(&text) {
+                            if sentence.len() <= 1 {
+                                continue;
+                            }
+                            lines.push('[');
+                            lines.push_str(&timestamp);
+                            lines.push_str("] ");
+                            lines.push_str(sentence);
+                            lines.push('\n');
                         }
-
-                        let _ = tx.send(VideoMessage::Segment {
-                            timestamp: format_timestamp(time_offset_secs),
-                            text,
-                        });
                     }
                 }
+                if !lines.is_empty() {
+                    let _ = tx.send(VideoMessage::Segments(lines));
+                }
+            }
+            // Whisper abandonó el fragmento porque se pidió cancelar
+            Err(_) if stop_signal.load(Ordering::SeqCst) => {
+                let _ = tx.send(VideoMessage::Status("Transcripción cancelada.".into()));
+                return Ok(());
             }
             Err(e) => eprintln!("Error en chunk {}: {:?}", chunk_idx, e),
         }
+
+        recycle(&recycle_tx, chunk);
+
+        chunk_idx += 1;
+    }
+
+    let _ = child.wait();
+    let read_result = reader.join()
+        .map_err(|_| anyhow!("El hilo lector de ffmpeg terminó inesperadamente"))?;
+    read_result?;
+
+    if chunk_idx == 0 {
+        return Err(anyhow!("ffmpeg no produjo audio. ¿Es un archivo de vídeo/audio válido?"));
     }
 
     let _ = tx.send(VideoMessage::Progress(1.0));
@@ -134,6 +175,81 @@ pub fn video_transcription_thread(
     Ok(())
 }
 
+/// Devuelve un fragmento ya transcrito al lector. Si el lector ya terminó
+/// el buffer simplemente se libera.
+fn recycle(tx: &Sender<Vec<f32>>, mut chunk: Vec<f32>) {
+    chunk.clear();
+    let _ = tx.send(chunk);
+}
+
+/// Lee la salida f32le de ffmpeg en bloques grandes y la entrega por `tx`
+/// en fragmentos de `chunk_samples` muestras (el último puede ser menor).
+/// Reutiliza los buffers que llegan por `recycled` antes de reservar otros.
+/// Termina sin error si el receptor se ha cerrado (transcripción cancelada).
+fn read_audio_chunks(
+    mut stdout: impl Read,
+    tx: SyncSender<Vec<f32>>,
+    recycled: Receiver<Vec<f32>>,
+    chunk_samples: usize,
+) -> std::io::Result<()> {
+    let mut block = vec![0u8; FFMPEG_READ_BLOCK];
+    let mut filled = 0;
+    let mut chunk: Vec<f32> = Vec::with_capacity(chunk_samples);
+    let next_buffer = || recycled.try_recv()
+        .unwrap_or_else(|_| Vec::with_capacity(chunk_samples));
+
+    loop {
+        let n = match stdout.read(&mut block[filled..]) {
+            Ok(0) => break,
+            Ok(n) => n,
+            Err(e) if e.kind() == std::io::ErrorKind::Interrupted => continue,
+            Err(e) => return Err(e),
+        };
+        filled += n;
+
+        // Una muestra puede quedar partida entre dos lecturas
+        let whole = filled - filled % 4;
+        // Se copia por tramos hasta llenar cada fragmento, no muestra a
+        // muestra: el bucle de conversión no comprueba nada más.
+        let mut bytes = &block[..whole];
+        while !bytes.is_empty() {
+            let take = (chunk_samples - chunk.len()).min(bytes.len() / 4) * 4;
+            let (head, rest) = bytes.split_at(take);
+            chunk.extend(head.chunks_exact(4).map(|b| f32::from_le_bytes([b[0], b[1], b[2], b[3]])));
+            bytes = rest;
+            if chunk.len() == chunk_samples {
+                let full = std::mem::replace(&mut chunk, next_buffer());
+                if tx.send(full).is_err() {
+                    return Ok(());
+                }
+            }
+        }
+        block.copy_within(whole..filled, 0);
+        filled -= whole;
+    }
+
+    if !chunk.is_empty() {
+        let _ = tx.send(chunk);
+    }
+    Ok(())
+}
+
+/// Duración del archivo según ffprobe. `None` si ffprobe no está disponible
+/// o no sabe calcularla; en ese caso no se muestra progreso porcentual.
+fn probe_duration_secs(file_path: &str) -> Option<f64> {
+    let out = Command::new("ffprobe")
+        .args(&[
+            "-v", "error",
+            "-show_entries", "format=duration",
+            "-of", "default=noprint_wrappers=1:nokey=1",
+            file_path,
+        ])
+        .stderr(Stdio::null())
+        .output()
+        .ok()?;
+    String::from_utf8_lossy(&out.stdout).trim().parse().ok()
+}
+
 fn format_timestamp(secs: f64) -> String {
     let h = (secs / 3600.0) as u64;
     let m = ((secs % 3600.0) / 60.0) as u64;
@@ -143,4 +259,67 @@ fn format_timestamp(secs: f64) -> String {
     } else {
         format!("{:02}:{:02}", m, s)
     }
-}
\ No newline at end of file
+}
+
+/// Parte `text` en frases, cortando tras '.', '?', '!' o '…' seguidos de
+/// espacio, y sin espacios en los extremos.
+fn sentences(text: &str) -> impl Iterator<Item = &str> {
+    let mut rest = text;
+    std::iter::from_fn(move || {
+        rest = rest.trim_start();
+        if rest.is_empty() {
+            return None;
+        }
+        let end = rest.char_indices()
+            .map(|(i, c)| (i + c.len_utf8(), c))
+            .find(|&(end, c)| {
+                matches!(c, '.' | '?' | '!' | '…') && rest[end..].starts_with(char::is_whitespace)
+            })
+            .map_or(rest.len(), |(end, _)| end);
+        let (sentence, tail) = rest.split_at(end);
+        rest = tail;
+        Some(sentence.trim_end())
+    })
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::test_util::Trickle;
+
+    #[test]
+    fn splits_ffmpeg_output_into_chunks_across_partial_reads() {
+        let samples: Vec<f32> = (0..25).map(|i| i as f32).collect();
+        let bytes: Vec<u8> = samples.iter().flat_map(|s| s.to_le_bytes()).collect();
+        let stdout = Trickle::new(&bytes, &[6, 1, 13, 3]);
+
+        let (chunk_tx, chunk_rx) = sync_channel(8);
+        let (_recycle_tx, recycle_rx) = channel();
+        read_audio_chunks(stdout, chunk_tx, recycle_rx, 10).unwrap();
+
+        let chunks: Vec<Vec<f32>> = chunk_rx.iter().collect();
+        assert_eq!(chunks.iter().map(Vec::len).collect::<Vec<_>>(), [10, 10, 5]);
+        assert_eq!(chunks.concat(), samples);
+    }
+
+    #[test]
+    fn stops_quietly_when_the_receiver_is_gone() {
+        let bytes = vec![0u8; 4 * 40];
+        let stdout = Trickle::new(&bytes, &[64]);
+        let (chunk_tx, chunk_rx) = sync_channel(8);
+        let (_recycle_tx, recycle_rx) = channel();
+        drop(chunk_rx);
+        assert!(read_audio_chunks(stdout, chunk_tx, recycle_rx, 10).is_ok());
+    }
+
+    #[test]
+    fn splits_segment_text_into_sentences() {
+        let text = " Hola a todos. ¿Empezamos?  Son las 3.45… vale! ";
+        assert_eq!(
+            sentences(text).collect::<Vec<_>>(),
+            ["Hola a todos.", "¿Empezamos?", "Son las 3.45…", "vale!"],
+        );
+        assert_eq!(sentences("sin punto final").collect::<Vec<_>>(), ["sin punto final"]);
+        assert_eq!(sentences("   ").count(), 0);
+    }
+}